@@ -0,0 +1,92 @@
+# scripts/bench_book_memory.py
+"""Memory and GC pauses of an in-memory book: array-backed OrderBook against a list of OrderModel objects.
+
+Usage: python scripts/bench_book_memory.py --orders 1000000 --models 100000
+No database needed: orders are generated in memory. Fewer OrderModel objects are built by default,
+since a million ORM objects take several gigabytes; bytes per order barely depend on the count.
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "postgresql+asyncpg://localhost/unused")
+
+from src.book import OrderBook  # noqa: E402
+from src.models.order import OrderModel, OrderType  # noqa: E402
+from src.schemas.schemas import Direction, OrderStatus, TimeInForce  # noqa: E402
+
+
+def make_orders(n: int, levels: int):
+    mid = 100000
+    users = [uuid.uuid4() for _ in range(1000)]
+    now = datetime.now(timezone.utc)
+    for seq in range(1, n + 1):
+        is_bid = random.random() < 0.5
+        offset = random.randint(1, levels)
+        yield (uuid.uuid4(), random.choice(users), is_bid, mid - offset if is_bid else mid + offset,
+               random.randint(1, 1000), seq, now)
+
+
+def build_book(n: int, levels: int) -> OrderBook:
+    book = OrderBook("BENCH")
+    for order_id, user_id, is_bid, price, qty, seq, timestamp in make_orders(n, levels):
+        book.add(order_id, user_id, is_bid, price, qty, 0, seq, seq, timestamp.timestamp())
+    return book
+
+
+def build_models(n: int, levels: int):
+    return [
+        OrderModel(
+            id=order_id, status=OrderStatus.NEW, user_id=user_id, timestamp=timestamp,
+            direction=Direction.BUY if is_bid else Direction.SELL, ticker="BENCH", qty=qty, price=price,
+            filled=0, time_in_force=TimeInForce.GTC, entry_seq=seq, seq=seq, type=OrderType.LIMIT
+        )
+        for order_id, user_id, is_bid, price, qty, seq, timestamp in make_orders(n, levels)
+    ]
+
+
+def measure(name: str, build, n: int, levels: int, repeat: int):
+    gc.collect()
+    tracemalloc.start()
+    state = build(n, levels)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # A full collection walks every tracked object, which is what a generation 2 pause looks like
+    pauses = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        gc.collect()
+        pauses.append(time.perf_counter() - started)
+    print(
+        f"{name:<10} orders={n:>8} bytes/order={size / n:8.1f} "
+        f"total={size / 2 ** 20:8.1f} MiB gc_pause max={max(pauses) * 1000:8.2f} ms "
+        f"min={min(pauses) * 1000:8.2f} ms tracked={len(gc.get_objects()):>9}"
+    )
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=1000000)
+    parser.add_argument("--models", type=int, default=100000, help="OrderModel objects to build for comparison; 0 skips them")
+    parser.add_argument("--levels", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    book = measure("OrderBook", build_book, args.orders, args.levels, args.repeat)
+    assert len(book) == args.orders
+    del book
+    if args.models:
+        measure("OrderModel", build_models, args.models, args.levels, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# scripts/bench_depth.py
+"""Compare full-depth book aggregation: aggregate_levels over order objects against NumPy aggregate_depth.
+
+Usage: python scripts/bench_depth.py --orders 100000 --group 10
+No database needed: orders are generated in memory.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "postgresql+asyncpg://localhost/unused")
+
+from src.depth import aggregate_depth  # noqa: E402
+from src.utils import aggregate_levels  # noqa: E402
+
+
+def make_rows(n: int, levels: int):
+    mid = 100000
+    rows = []
+    for _ in range(n):
+        is_bid = random.random() < 0.5
+        offset = random.randint(1, levels)
+        price = mid - offset if is_bid else mid + offset
+        rows.append((is_bid, price, random.randint(1, 1000)))
+    return rows
+
+
+def measure(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--levels", type=int, default=20000)
+    parser.add_argument("--group", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.orders, args.levels)
+    # The old path works on order objects, like the OrderModel rows from get_bids/get_asks
+    orders = [SimpleNamespace(type="LIMIT", price=price, qty=qty, filled=0, is_bid=is_bid) for is_bid, price, qty in rows]
+    bids = [o for o in orders if o.is_bid]
+    asks = [o for o in orders if not o.is_bid]
+
+    def old():
+        return {
+            "bid_levels": aggregate_levels(bids, is_bid=True),
+            "ask_levels": aggregate_levels(asks, is_bid=False)
+        }
+
+    # Columns arrive like this from get_resting_quantities: one array per column
+    is_bid, prices, qtys = (list(column) for column in zip(*rows))
+
+    def new():
+        return aggregate_depth(is_bid, prices, qtys)
+
+    expected = old()
+    actual = new()
+    for side in ("bid_levels", "ask_levels"):
+        assert [(level["price"], level["qty"]) for level in actual[side]] == \
+            [(level["price"], level["qty"]) for level in expected[side]], f"{side}: levels differ"
+
+    old_time = measure(old, args.repeat)
+    new_time = measure(new, args.repeat)
+    grouped_time = measure(lambda: aggregate_depth(is_bid, prices, qtys, group=args.group), args.repeat)
+    print(
+        f"orders={args.orders} levels={len(actual['bid_levels']) + len(actual['ask_levels'])} "
+        f"python={old_time * 1000:8.2f} ms numpy={new_time * 1000:7.2f} ms speedup={old_time / new_time:5.1f}x "
+        f"numpy_group_{args.group}={grouped_time * 1000:7.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
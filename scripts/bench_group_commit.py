@@ -0,0 +1,137 @@
+# scripts/bench_group_commit.py
+"""Compare POST /api/v1/order throughput with ORDER_PERSISTENCE=request and group.
+
+Usage: DATABASE_URL=... python scripts/bench_group_commit.py --orders 5000 --concurrency 64
+Each mode runs in its own process; the app is called directly over ASGI.
+The book is wiped with POST /api/v1/admin/reset before each run, so use a test database only.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ADMIN_KEY = "175b6f1fc25c47e69ff73442f96298ae"
+TICKER = "BENCH"
+
+
+async def call(app, method: str, path: str, body=None, api_key: str = ADMIN_KEY):
+    raw = json.dumps(body).encode() if body is not None else b""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"authorization", f"TOKEN {api_key}".encode())],
+        "client": ("bench", 0),
+        "server": ("bench", 80),
+    }
+    received = False
+    response = {"status": None, "body": b""}
+
+    async def receive():
+        nonlocal received
+        if received:
+            await asyncio.Event().wait()
+        received = True
+        return {"type": "http.request", "body": raw, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response["status"], json.loads(response["body"] or b"null")
+
+
+async def prepare(app, users: int):
+    status, detail = await call(app, "POST", "/api/v1/admin/reset")
+    assert status == 200, detail
+    await call(app, "POST", "/api/v1/admin/instrument", {"name": "bench", "ticker": TICKER})
+    status, created = await call(
+        app, "POST", "/api/v1/admin/user/bulk", [{"name": f"bench-{uuid4().hex[:12]}"} for _ in range(users)]
+    )
+    assert status == 200, created
+    deposits = []
+    for user in created:
+        deposits.append({"user_id": user["id"], "ticker": "RUB", "amount": 10 ** 9})
+        deposits.append({"user_id": user["id"], "ticker": TICKER, "amount": 10 ** 9})
+    status, detail = await call(app, "POST", "/api/v1/admin/balance/deposit/bulk", deposits)
+    assert status == 200, detail
+    return [user["api_key"] for user in created]
+
+
+async def run(orders: int, concurrency: int, users: int) -> dict:
+    from src.main import app
+
+    async with app.router.lifespan_context(app):
+        keys = await prepare(app, users)
+        latencies = []
+        errors = 0
+        counter = iter(range(orders))
+
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                # Buys and sells never cross so that only the writes are measured
+                if i % 2:
+                    body = {"direction": "BUY", "ticker": TICKER, "qty": 1, "price": 1 + i % 50}
+                else:
+                    body = {"direction": "SELL", "ticker": TICKER, "qty": 1, "price": 100 + i % 50}
+                started = time.perf_counter()
+                status, _ = await call(app, "POST", "/api/v1/order", body, keys[i % len(keys)])
+                latencies.append(time.perf_counter() - started)
+                if status != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "mode": os.getenv("ORDER_PERSISTENCE", "request"),
+        "orders": orders,
+        "errors": errors,
+        "orders_per_sec": round(orders / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--mode", choices=["request", "group"])
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(asyncio.run(run(args.orders, args.concurrency, args.users))))
+        return
+
+    for mode in ("request", "group"):
+        env = dict(os.environ, ORDER_PERSISTENCE=mode)
+        result = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--orders", str(args.orders),
+             "--concurrency", str(args.concurrency), "--users", str(args.users)],
+            env=env, capture_output=True, text=True, check=True
+        )
+        print(result.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# scripts/bench_serialization.py
+"""Compare the old response serialization (Pydantic models plus response_model revalidation)
+with FastJSONResponse for order lists, trade history and book levels.
+
+Usage: python scripts/bench_serialization.py --rows 10000
+No database needed: rows are built in memory.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Union
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "postgresql+asyncpg://localhost/unused")
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_model_field  # noqa: E402
+
+from src.models.order import OrderModel, OrderType  # noqa: E402
+from src.models.transaction import TransactionModel  # noqa: E402
+from src.schemas.schemas import (  # noqa: E402
+    Direction,
+    L2OrderBook,
+    LimitOrder,
+    MarketOrder,
+    OrderStatus,
+    TimeInForce,
+    Transaction
+)
+from src.serialization import FastJSONResponse, order_rows, transaction_rows  # noqa: E402
+from src.utils import aggregate_levels, aggregate_orders, create_order_dict  # noqa: E402
+
+
+def make_orders(n: int) -> List[OrderModel]:
+    now = datetime.now(timezone.utc)
+    user_id = uuid4()
+    orders = []
+    for i in range(n):
+        is_market = i % 5 == 0
+        orders.append(OrderModel(
+            id=uuid4(),
+            status=random.choice(list(OrderStatus)),
+            user_id=user_id,
+            timestamp=now - timedelta(microseconds=i * 137),
+            direction=random.choice(list(Direction)),
+            ticker="MEMCOIN",
+            qty=random.randint(1, 1000),
+            price=None if is_market else random.randint(1, 10 ** 6),
+            type=OrderType.MARKET if is_market else OrderType.LIMIT,
+            filled=-1 if is_market else 0,
+            time_in_force=TimeInForce.GTC,
+            entry_seq=i,
+            seq=i
+        ))
+    return orders
+
+
+def make_transactions(n: int) -> List[TransactionModel]:
+    now = datetime.now(timezone.utc)
+    return [
+        TransactionModel(id=i, ticker="MEMCOIN", price=random.randint(1, 10 ** 6),
+                         qty=random.randint(1, 1000), seq=i, timestamp=now - timedelta(microseconds=i * 137))
+        for i in range(n)
+    ]
+
+
+async def old_body(response_type, content) -> bytes:
+    field = create_model_field(name="Response", type_=response_type, mode="serialization")
+    return JSONResponse(await serialize_response(field=field, response_content=content)).body
+
+
+def measure(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark response serialization")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    orders = make_orders(args.rows)
+    transactions = make_transactions(args.rows)
+    book = [o for o in orders if o.type == OrderType.LIMIT]
+
+    cases = {
+        "list_orders": (
+            lambda: asyncio.run(old_body(
+                List[Union[LimitOrder, MarketOrder]], [create_order_dict(o) for o in orders]
+            )),
+            lambda: FastJSONResponse(order_rows(orders)).body
+        ),
+        "transactions": (
+            lambda: asyncio.run(old_body(List[Transaction], [
+                Transaction(ticker=tx.ticker, amount=tx.qty, price=tx.price, timestamp=tx.timestamp, seq=tx.seq)
+                for tx in transactions
+            ])),
+            lambda: FastJSONResponse(transaction_rows(transactions)).body
+        ),
+        "orderbook": (
+            lambda: asyncio.run(old_body(L2OrderBook, L2OrderBook(
+                bid_levels=aggregate_orders(book, is_bid=True),
+                ask_levels=aggregate_orders(book, is_bid=False)
+            ))),
+            lambda: FastJSONResponse({
+                "bid_levels": aggregate_levels(book, is_bid=True),
+                "ask_levels": aggregate_levels(book, is_bid=False)
+            }).body
+        )
+    }
+
+    for name, (old, new) in cases.items():
+        assert json.loads(old()) == json.loads(new()), f"{name}: responses differ"
+        old_time = measure(old, args.repeat)
+        new_time = measure(new, args.repeat)
+        print(
+            f"{name:<13} rows={args.rows} pydantic={old_time * 1000:8.2f} ms "
+            f"fast={new_time * 1000:7.2f} ms speedup={old_time / new_time:5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
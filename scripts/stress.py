@@ -0,0 +1,307 @@
+# scripts/stress.py
+"""Load run with balance invariant checks: orders, cancels and admin withdrawals at once.
+
+Usage: DATABASE_URL=... python scripts/stress.py --ops 20000 --concurrency 64 --users 50
+The app is called directly over ASGI. The book is wiped with POST /api/v1/admin/reset first,
+so use a test database only. A separate connection polls pg_locks and pg_stat_activity during the run.
+Afterwards, for the run's users, it checks that:
+    - 0 <= reserved <= amount in every balance and balance_stripe row;
+    - reserved per (user, ticker) equals open orders: sell remainder in the ticker, remainder x price of buys in RUB;
+    - total amount per ticker equals deposits minus successful withdrawals.
+Exits with 1 if any invariant is broken.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ADMIN_KEY = "175b6f1fc25c47e69ff73442f96298ae"
+MID_PRICE = 100
+
+HELD_SQL = """
+    SELECT user_id, instrument_ticker AS ticker, amount, reserved FROM balance WHERE user_id = ANY(:users)
+    UNION ALL
+    SELECT user_id, instrument_ticker, amount, reserved FROM balance_stripe WHERE user_id = ANY(:users)
+"""
+
+ROW_VIOLATIONS_SQL = f"""
+    SELECT user_id, ticker, amount, reserved FROM ({HELD_SQL}) AS held
+    WHERE reserved < 0 OR amount < 0 OR reserved > amount
+"""
+
+EXPOSURE_VIOLATIONS_SQL = f"""
+    WITH held AS (
+        SELECT user_id, ticker, sum(reserved) AS reserved FROM ({HELD_SQL}) AS rows GROUP BY user_id, ticker
+    ), exposure AS (
+        SELECT user_id,
+               CASE WHEN direction = 'SELL' THEN ticker ELSE 'RUB' END AS ticker,
+               sum(CASE WHEN direction = 'SELL' THEN qty - filled ELSE (qty - filled) * price END) AS expected
+        FROM orders
+        WHERE status IN ('NEW', 'PARTIALLY_EXECUTED') AND price IS NOT NULL AND user_id = ANY(:users)
+        GROUP BY 1, 2
+    )
+    SELECT coalesce(held.user_id, exposure.user_id) AS user_id, coalesce(held.ticker, exposure.ticker) AS ticker,
+           coalesce(held.reserved, 0) AS reserved, coalesce(exposure.expected, 0) AS expected
+    FROM held FULL JOIN exposure ON held.user_id = exposure.user_id AND held.ticker = exposure.ticker
+    WHERE coalesce(held.reserved, 0) <> coalesce(exposure.expected, 0)
+"""
+
+TOTALS_SQL = f"SELECT ticker, sum(amount) AS amount FROM ({HELD_SQL}) AS held GROUP BY ticker"
+
+LOCK_WAITS_SQL = """
+    SELECT l.locktype, l.mode, count(*) AS waiting
+    FROM pg_locks l
+    WHERE NOT l.granted
+    GROUP BY l.locktype, l.mode
+"""
+
+BLOCKED_SQL = """
+    SELECT count(*) AS blocked, coalesce(max(extract(epoch FROM now() - query_start)), 0) AS longest
+    FROM pg_stat_activity
+    WHERE datname = current_database() AND wait_event_type = 'Lock'
+"""
+
+DEADLOCKS_SQL = "SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()"
+
+
+async def call(app, method: str, path: str, body=None, api_key: str = ADMIN_KEY):
+    raw = json.dumps(body).encode() if body is not None else b""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"authorization", f"TOKEN {api_key}".encode())],
+        "client": ("stress", 0),
+        "server": ("stress", 80),
+    }
+    received = False
+    response = {"status": None, "body": b""}
+
+    async def receive():
+        nonlocal received
+        if received:
+            await asyncio.Event().wait()
+        received = True
+        return {"type": "http.request", "body": raw, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response["status"], json.loads(response["body"] or b"null")
+
+
+async def prepare(app, users: int, tickers: list, rub_deposit: int, ticker_deposit: int, striped: int, stripes: int):
+    status, detail = await call(app, "POST", "/api/v1/admin/reset")
+    assert status == 200, detail
+    for ticker in tickers:
+        await call(app, "POST", "/api/v1/admin/instrument", {"name": ticker.lower(), "ticker": ticker})
+    status, created = await call(
+        app, "POST", "/api/v1/admin/user/bulk", [{"name": f"stress-{uuid4().hex[:12]}"} for _ in range(users)]
+    )
+    assert status == 200, created
+    deposits = []
+    for user in created:
+        deposits.append({"user_id": user["id"], "ticker": "RUB", "amount": rub_deposit})
+        for ticker in tickers:
+            deposits.append({"user_id": user["id"], "ticker": ticker, "amount": ticker_deposit})
+    status, detail = await call(app, "POST", "/api/v1/admin/balance/deposit/bulk", deposits)
+    assert status == 200, detail
+    # The first striped users are hot market-maker accounts split into stripes
+    for user in created[:striped]:
+        for ticker in ["RUB", *tickers]:
+            status, detail = await call(
+                app, "POST", "/api/v1/admin/balance/stripe", {"user_id": user["id"], "ticker": ticker, "stripes": stripes}
+            )
+            assert status == 200, detail
+    funded = {"RUB": rub_deposit * users, **{ticker: ticker_deposit * users for ticker in tickers}}
+    return created, funded
+
+
+async def sample_locks(engine, stop: asyncio.Event, interval: float, stats: dict):
+    from sqlalchemy import text
+
+    async with engine.connect() as conn:
+        while not stop.is_set():
+            result = await conn.execute(text(LOCK_WAITS_SQL))
+            waiting = 0
+            for row in result:
+                key = f"{row.locktype}/{row.mode}"
+                stats["waiting_by_mode"][key] = max(stats["waiting_by_mode"].get(key, 0), row.waiting)
+                waiting += row.waiting
+            row = (await conn.execute(text(BLOCKED_SQL))).one()
+            await conn.rollback()
+            stats["samples"] += 1
+            stats["samples_with_waiters"] += waiting > 0
+            stats["max_waiting_locks"] = max(stats["max_waiting_locks"], waiting)
+            stats["max_blocked_backends"] = max(stats["max_blocked_backends"], row.blocked)
+            stats["longest_lock_wait_ms"] = max(stats["longest_lock_wait_ms"], round(float(row.longest) * 1000, 1))
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def check_invariants(engine, user_ids: list, funded: dict, withdrawn: Counter) -> dict:
+    from sqlalchemy import text
+
+    params = {"users": user_ids}
+    async with engine.connect() as conn:
+        rows = (await conn.execute(text(ROW_VIOLATIONS_SQL), params)).all()
+        exposure = (await conn.execute(text(EXPOSURE_VIOLATIONS_SQL), params)).all()
+        totals = {row.ticker: row.amount for row in await conn.execute(text(TOTALS_SQL), params)}
+
+    conservation = {
+        ticker: {"expected": amount - withdrawn[ticker], "actual": totals.get(ticker, 0)}
+        for ticker, amount in funded.items()
+        if totals.get(ticker, 0) != amount - withdrawn[ticker]
+    }
+    return {
+        "reserved_over_amount": len(rows),
+        "reserved_over_amount_examples": [
+            {"user_id": str(r.user_id), "ticker": r.ticker, "amount": r.amount, "reserved": r.reserved} for r in rows[:5]
+        ],
+        "reserved_vs_open_orders": len(exposure),
+        "reserved_vs_open_orders_drift": sum(int(r.reserved - r.expected) for r in exposure),
+        "reserved_vs_open_orders_examples": [
+            {"user_id": str(r.user_id), "ticker": r.ticker, "reserved": int(r.reserved), "expected": int(r.expected)}
+            for r in exposure[:5]
+        ],
+        "conservation": conservation,
+    }
+
+
+async def run(args) -> dict:
+    from sqlalchemy import text
+
+    from src.database.database import async_engine
+    from src.database.retry import retries_exhausted_total, retries_total
+    from src.main import app
+
+    tickers = [f"STR{chr(ord('A') + i)}" for i in range(args.tickers)]
+    async with app.router.lifespan_context(app):
+        users, funded = await prepare(
+            app, args.users, tickers, args.rub_deposit, args.ticker_deposit, args.striped_users, args.stripes
+        )
+        open_orders = {user["id"]: [] for user in users}
+        withdrawn = Counter()
+        outcomes = Counter()
+        rng = random.Random(args.seed)
+        counter = iter(range(args.ops))
+
+        async def operation():
+            user = rng.choice(users)
+            roll = rng.random()
+            if roll < args.withdraw_ratio:
+                ticker = rng.choice(["RUB", *tickers])
+                # Up to a tenth of the initial deposit: accounts quickly approach their free balance
+                amount = rng.randint(1, (args.rub_deposit if ticker == "RUB" else args.ticker_deposit) // 10)
+                status, _ = await call(
+                    app, "POST", "/api/v1/admin/balance/withdraw",
+                    {"user_id": user["id"], "ticker": ticker, "amount": amount}
+                )
+                if status == 200:
+                    withdrawn[ticker] += amount
+                outcomes[f"withdraw {status}"] += 1
+                return
+
+            if roll < args.withdraw_ratio + args.cancel_ratio and open_orders[user["id"]]:
+                ids = open_orders[user["id"]]
+                order_id = ids.pop(rng.randrange(len(ids)))
+                status, _ = await call(app, "DELETE", f"/api/v1/order/{order_id}", api_key=user["api_key"])
+                outcomes[f"cancel {status}"] += 1
+                return
+
+            body = {"direction": rng.choice(["BUY", "SELL"]), "ticker": rng.choice(tickers), "qty": rng.randint(1, 20)}
+            kind = "market"
+            if rng.random() >= args.market_ratio:
+                kind = "limit"
+                body["price"] = MID_PRICE + rng.randint(-args.spread, args.spread)
+                body["time_in_force"] = rng.choice(["GTC", "GTC", "GTC", "IOC", "FOK"])
+            status, order = await call(app, "POST", "/api/v1/order", body, user["api_key"])
+            if status == 200 and kind == "limit":
+                open_orders[user["id"]].append(order["order_id"])
+            outcomes[f"{kind} {status}"] += 1
+
+        async def worker():
+            for _ in counter:
+                await operation()
+
+        async with async_engine.connect() as conn:
+            deadlocks_before = (await conn.execute(text(DEADLOCKS_SQL))).scalar_one()
+
+        locks = {
+            "samples": 0, "samples_with_waiters": 0, "max_waiting_locks": 0,
+            "max_blocked_backends": 0, "longest_lock_wait_ms": 0.0, "waiting_by_mode": {}
+        }
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_locks(async_engine, stop, args.sample_interval, locks))
+        retries_before = dict(retries_total.values)
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await sampler
+
+        async with async_engine.connect() as conn:
+            deadlocks_after = (await conn.execute(text(DEADLOCKS_SQL))).scalar_one()
+        invariants = await check_invariants(async_engine, [user["id"] for user in users], funded, withdrawn)
+
+    return {
+        "ops": args.ops,
+        "ops_per_sec": round(args.ops / elapsed, 1),
+        "outcomes": dict(sorted(outcomes.items())),
+        "deadlocks": deadlocks_after - deadlocks_before,
+        "retries": {
+            " ".join(labels): value - retries_before.get(labels, 0)
+            for labels, value in retries_total.values.items()
+            if value != retries_before.get(labels, 0)
+        },
+        "retries_exhausted": {" ".join(labels): value for labels, value in retries_exhausted_total.values.items()},
+        "locks": locks,
+        "invariants": invariants,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--tickers", type=int, default=2)
+    parser.add_argument("--rub-deposit", type=int, default=100000)
+    parser.add_argument("--ticker-deposit", type=int, default=1000)
+    parser.add_argument("--spread", type=int, default=5, help="spread of limit prices around the mid; smaller means more trades")
+    parser.add_argument("--cancel-ratio", type=float, default=0.2)
+    parser.add_argument("--withdraw-ratio", type=float, default=0.05)
+    parser.add_argument("--market-ratio", type=float, default=0.1)
+    parser.add_argument("--striped-users", type=int, default=0, help="users whose accounts are split into stripes")
+    parser.add_argument("--stripes", type=int, default=8)
+    parser.add_argument("--sample-interval", type=float, default=0.05)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    invariants = report["invariants"]
+    if invariants["reserved_over_amount"] or invariants["reserved_vs_open_orders"] or invariants["conservation"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
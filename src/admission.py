@@ -0,0 +1,176 @@
+# src/admission.py
+import json
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from uuid import UUID
+
+from src.asgi import read_body, replay_body, send_json
+from src.metrics import Counter, Gauge
+
+
+# Refill rate and capacity of the token bucket per API key; 0 disables the limit
+RATE_LIMIT_RPS = float(os.getenv("RATE_LIMIT_RPS", "100"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "200"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Orders in flight at once, in total and per ticker; 0 disables the limit
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "256"))
+ADMISSION_MAX_IN_FLIGHT_PER_TICKER = int(os.getenv("ADMISSION_MAX_IN_FLIGHT_PER_TICKER", "32"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+ORDER_PATH = "/api/v1/order"
+ORDER_ID_PATH = re.compile(r"^/api/v1/order/[^/]+$")
+
+in_flight_gauge = Gauge(
+    "order_admission_in_flight",
+    "Order requests admitted and not yet answered",
+    ("ticker",)
+)
+rejected_total = Counter(
+    "order_admission_rejected_total",
+    "Order requests rejected before touching the database",
+    ("reason",)
+)
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+
+class RateLimiter:
+
+    def __init__(self, rate: float, burst: float, max_keys: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # Least recently used keys first
+        self._buckets: "OrderedDict[bytes, TokenBucket]" = OrderedDict()
+        # Shared by unseen keys while the map is full of buckets that still hold state
+        self._overflow = TokenBucket(burst, time.monotonic())
+
+    def _evict_idle(self, now: float) -> bool:
+        """Evicts the least recently used key only once its bucket has refilled, so no allowance is raised."""
+        if not self._buckets:
+            return False
+        key, bucket = next(iter(self._buckets.items()))
+        if bucket.tokens + (now - bucket.updated_at) * self.rate < self.burst:
+            return False
+        del self._buckets[key]
+        return True
+
+    def acquire(self, key: bytes) -> Optional[float]:
+        """Takes a token; when none is left, returns the seconds until the next one."""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            self._buckets.move_to_end(key)
+        elif len(self._buckets) < self.max_keys or self._evict_idle(now):
+            bucket = self._buckets[key] = TokenBucket(self.burst, now)
+        else:
+            bucket = self._overflow
+        bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated_at) * self.rate)
+        bucket.updated_at = now
+
+        if bucket.tokens < 1:
+            return (1 - bucket.tokens) / self.rate
+        bucket.tokens -= 1
+        return None
+
+
+def rate_limit_key(authorization: bytes) -> bytes:
+    """The API key from the header; an empty or malformed header maps to one shared bucket."""
+    _, _, token = authorization.partition(b" ")
+    try:
+        return UUID(token.decode()).bytes
+    except ValueError:
+        return b""
+
+
+class AdmissionController:
+    """Caps the number of orders in flight, in total and per ticker."""
+
+    def __init__(self, max_in_flight: int, max_per_ticker: int):
+        self.max_in_flight = max_in_flight
+        self.max_per_ticker = max_per_ticker
+        self.in_flight = 0
+        self.per_ticker: Dict[str, int] = {}
+
+    def try_enter(self, ticker: Optional[str]) -> Optional[str]:
+        """Returns the rejection reason, or None when the order is admitted."""
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return "overloaded"
+        if ticker is not None and self.max_per_ticker and self.per_ticker.get(ticker, 0) >= self.max_per_ticker:
+            return "ticker_overloaded"
+        self.in_flight += 1
+        if ticker is not None:
+            self.per_ticker[ticker] = self.per_ticker.get(ticker, 0) + 1
+        in_flight_gauge.inc(ticker or "")
+        return None
+
+    def leave(self, ticker: Optional[str]):
+        self.in_flight -= 1
+        in_flight_gauge.dec(ticker or "")
+        if ticker is not None:
+            self.per_ticker[ticker] -= 1
+            if not self.per_ticker[ticker]:
+                # The ticker comes from the request body, so idle labels are not kept
+                del self.per_ticker[ticker]
+                in_flight_gauge.remove(ticker)
+
+
+rate_limiter = RateLimiter(RATE_LIMIT_RPS, RATE_LIMIT_BURST, RATE_LIMIT_MAX_KEYS)
+admission = AdmissionController(ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_IN_FLIGHT_PER_TICKER)
+
+
+class AdmissionMiddleware:
+    """Rejects excess orders with 429/503 before the request takes a pooled connection."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (
+            (scope["method"] == "POST" and scope["path"] == ORDER_PATH)
+            or (scope["method"] == "DELETE" and ORDER_ID_PATH.match(scope["path"]))
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        if RATE_LIMIT_RPS > 0:
+            api_key = rate_limit_key(dict(scope["headers"]).get(b"authorization", b""))
+            wait = rate_limiter.acquire(api_key)
+            if wait is not None:
+                rejected_total.inc("rate_limited")
+                await send_json(send, 429, b'{"detail":"Too Many Requests"}',
+                                [(b"retry-after", str(math.ceil(wait)).encode())])
+                return
+
+        ticker = None
+        if scope["method"] == "POST":
+            body = await read_body(receive)
+            try:
+                ticker = json.loads(body).get("ticker")
+            except (ValueError, AttributeError):
+                pass
+            if not isinstance(ticker, str):
+                ticker = None
+            receive = replay_body(body, receive)
+
+        reason = admission.try_enter(ticker)
+        if reason is not None:
+            rejected_total.inc(reason)
+            await send_json(send, 503, b'{"detail":"Service overloaded, retry later"}',
+                            [(b"retry-after", str(ADMISSION_RETRY_AFTER).encode())])
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.leave(ticker)
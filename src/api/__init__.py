@@ -4,6 +4,7 @@ from src.api.public import router as public_router
 from src.api.balance import router as balance_router
 from src.api.order import router as order_router
 from src.api.admin import router as admin_router
+from src.api.metrics import router as metrics_router
 
 
 main_router = APIRouter()
@@ -12,3 +13,4 @@ main_router.include_router(public_router)
 main_router.include_router(balance_router)
 main_router.include_router(order_router)
 main_router.include_router(admin_router)
+main_router.include_router(metrics_router)
@@ -2,15 +2,21 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
+from typing import List
 
 from src.database.database import get_db
+from src.database.retry import run_transaction
+from src.etags import invalidate_all, invalidate_instruments, invalidate_market_data
 from src.security import api_key_header
+from src.snapshots import drop_orderbook_snapshot, drop_orderbook_snapshots
 from src.schemas.schemas import (
+    NewUser,
     User,
     Instrument,
     Ok,
     Body_deposit_api_v1_admin_balance_deposit_post,
     Body_withdraw_api_v1_admin_balance_withdraw_post,
+    Body_stripe_api_v1_admin_balance_stripe_post,
 )
 from src.utils import (
     check_user_is_admin,
@@ -19,6 +25,11 @@ from src.utils import (
     delete_instrument_by_ticker,
     user_balance_deposit,
     user_balance_withdraw,
+    reset_orders,
+    bulk_register_users,
+    bulk_balance_deposit,
+    bulk_balance_withdraw,
+    user_balance_stripe,
     get_api_key
 )
 
@@ -30,7 +41,12 @@ summary_tags = {
     "add_instrument": "Add Instrument",
     "delete_instrument": "Delete Instrument",
     "deposit": "Deposit",
-    "withdraw": "Withdraw"
+    "withdraw": "Withdraw",
+    "reset_orders": "Reset Orders",
+    "bulk_register": "Bulk Register",
+    "bulk_deposit": "Bulk Deposit",
+    "bulk_withdraw": "Bulk Withdraw",
+    "stripe": "Stripe Balance"
 }
 
 router = APIRouter()
@@ -53,8 +69,14 @@ async def delete_user(
     try:
         api_key = get_api_key(authorization)
         if await check_user_is_admin(UUID(api_key), db):
-            return await delete_user_by_id(UUID(user_id), db)
+            deleted_user = await delete_user_by_id(UUID(user_id), db)
+            # The user's orders are deleted by cascade
+            drop_orderbook_snapshots()
+            invalidate_all()
+            return deleted_user
 
+    except HTTPException:
+        raise
     except Exception:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
@@ -77,8 +99,11 @@ async def add_instrument(
         api_key = get_api_key(authorization)
         if await check_user_is_admin(UUID(api_key), db):
             await create_instrument(instrument, db)
+            invalidate_instruments()
         return Ok()
 
+    except HTTPException:
+        raise
     except Exception:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
@@ -101,8 +126,13 @@ async def delete_instrument(
         api_key = get_api_key(authorization)
         if await check_user_is_admin(UUID(api_key), db):
             await delete_instrument_by_ticker(ticker, db)
+            drop_orderbook_snapshot(ticker)
+            invalidate_instruments()
+            invalidate_market_data(ticker)
             return Ok()
 
+    except HTTPException:
+        raise
     except Exception:
         logger.exception("DELETE INSTRUMENT ERROR")
         raise HTTPException(status_code=401, detail="Unauthorized")
@@ -125,9 +155,11 @@ async def deposit(
     try:
         api_key = get_api_key(authorization)
         if await check_user_is_admin(UUID(api_key), db):
-            await user_balance_deposit(request, db)
+            await run_transaction(db, "deposit", lambda db: user_balance_deposit(request, db))
             return Ok()
 
+    except HTTPException:
+        raise
     except Exception:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
@@ -149,8 +181,142 @@ async def withdraw(
     try:
         api_key = get_api_key(authorization)
         if await check_user_is_admin(UUID(api_key), db):
-            await user_balance_withdraw(request, db)
+            await run_transaction(db, "withdraw", lambda db: user_balance_withdraw(request, db))
             return Ok()
 
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+
+@router.post(
+    path="/api/v1/admin/reset",
+    tags=["admin"],
+    response_model=Ok,
+    summary=summary_tags["reset_orders"]
+)
+async def reset(
+        authorization: str = Depends(api_key_header),
+        db: AsyncSession = Depends(get_db)
+):
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    try:
+        api_key = get_api_key(authorization)
+        if await check_user_is_admin(UUID(api_key), db):
+            await run_transaction(db, "reset_orders", reset_orders)
+            drop_orderbook_snapshots()
+            invalidate_all()
+            return Ok()
+
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+
+@router.post(
+    path="/api/v1/admin/user/bulk",
+    tags=["admin", "user"],
+    response_model=List[User],
+    summary=summary_tags["bulk_register"]
+)
+async def bulk_register(
+        users: List[NewUser],
+        authorization: str = Depends(api_key_header),
+        db: AsyncSession = Depends(get_db)
+):
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    try:
+        api_key = get_api_key(authorization)
+        if await check_user_is_admin(UUID(api_key), db):
+            return await run_transaction(db, "bulk_register", lambda db: bulk_register_users(users, db))
+
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+
+@router.post(
+    path="/api/v1/admin/balance/deposit/bulk",
+    tags=["admin", "balance"],
+    response_model=Ok,
+    summary=summary_tags["bulk_deposit"]
+)
+async def bulk_deposit(
+        requests: List[Body_deposit_api_v1_admin_balance_deposit_post],
+        authorization: str = Depends(api_key_header),
+        db: AsyncSession = Depends(get_db)
+):
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    try:
+        api_key = get_api_key(authorization)
+        if await check_user_is_admin(UUID(api_key), db):
+            if requests:
+                await run_transaction(db, "bulk_deposit", lambda db: bulk_balance_deposit(requests, db))
+            return Ok()
+
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+
+@router.post(
+    path="/api/v1/admin/balance/withdraw/bulk",
+    tags=["admin", "balance"],
+    response_model=Ok,
+    summary=summary_tags["bulk_withdraw"]
+)
+async def bulk_withdraw(
+        requests: List[Body_withdraw_api_v1_admin_balance_withdraw_post],
+        authorization: str = Depends(api_key_header),
+        db: AsyncSession = Depends(get_db)
+):
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    try:
+        api_key = get_api_key(authorization)
+        if await check_user_is_admin(UUID(api_key), db):
+            if requests:
+                await run_transaction(db, "bulk_withdraw", lambda db: bulk_balance_withdraw(requests, db))
+            return Ok()
+
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+
+@router.post(
+    path="/api/v1/admin/balance/stripe",
+    tags=["admin", "balance"],
+    response_model=Ok,
+    summary=summary_tags["stripe"]
+)
+async def stripe(
+        request: Body_stripe_api_v1_admin_balance_stripe_post,
+        authorization: str = Depends(api_key_header),
+        db: AsyncSession = Depends(get_db)
+):
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    try:
+        api_key = get_api_key(authorization)
+        if await check_user_is_admin(UUID(api_key), db):
+            await run_transaction(db, "stripe", lambda db: user_balance_stripe(request, db))
+            return Ok()
+
+    except HTTPException:
+        raise
     except Exception:
         raise HTTPException(status_code=401, detail="Unauthorized")
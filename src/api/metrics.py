@@ -0,0 +1,22 @@
+# src/api/metrics.py
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from src.metrics import render_metrics
+
+
+summary_tags = {
+    "get_metrics": "Get Metrics"
+}
+
+router = APIRouter()
+
+
+@router.get(
+    path="/metrics",
+    tags=["metrics"],
+    response_class=PlainTextResponse,
+    summary=summary_tags["get_metrics"]
+)
+async def get_metrics():
+    return render_metrics()
@@ -1,43 +1,51 @@
 # src/api/order.py
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List, Union
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Union
 from uuid import UUID
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.database import get_db
-from src.models.order import OrderStatus
+from src.database.database import get_db, get_read_db
+from src.database.group_commit import persist
+from src.models.order import OrderStatus, OrderType
+from src.etags import invalidate_market_data
+from src.executions import execution_stream, parse_fill_cursor
+from src.notifier import order_notifier, ORDER_WAIT_TIMEOUT, ORDER_WAIT_MAX_TIMEOUT
 from src.security import api_key_header
+from src.serialization import FastJSONResponse, order_rows
+from src.sharding import ticker_lock
+from src.snapshots import mark_orderbook_dirty
 from src.schemas.schemas import (
     LimitOrderBody,
     MarketOrderBody,
     LimitOrder,
     MarketOrder,
     CreateOrderResponse,
-    Direction,
+    Execution,
     Ok
 )
 from src.utils import (
-    create_order_in_db,
     get_order_by_id,
     get_user_by_api_key,
-    get_orders_by_user,
+    get_order_rows_by_user,
     get_instrument_by_ticker,
-    get_max_price_for_market_rub_reserve,
     # execute_market_sell_order,
     # execute_market_buy_order,
-    execute_market_order,
-    execute_limit_order,
     get_api_key,
     create_order_dict,
-    get_available_balance,
-    reserve_balance
+    place_order,
+    cancel_user_order,
+    get_fill_cursor
 )
 
 summary_tags = {
     "create_order": "Create Order",
     "list_orders": "List Orders",
     "get_order": "Get Order",
-    "cancel_order": "Cancel Order"
+    "wait_order": "Wait Order",
+    "cancel_order": "Cancel Order",
+    "stream_executions": "Stream Executions"
 }
 
 router = APIRouter()
@@ -70,44 +78,14 @@ async def create_order(
             raise HTTPException(status_code=404, detail=f"Ticker '{order_data.ticker}' Not Found")
 
         user_id = auth_user.id
-        max_price = None
-
-        if order_data.direction == Direction.SELL:
-            avail = await get_available_balance(user_id, order_data.ticker, db)
-            if avail < order_data.qty:
-                raise HTTPException(status_code=400, detail=f"Insufficient '{order_data.ticker}' balance for order")
-            await reserve_balance(user_id, order_data.ticker, order_data.qty, db)
-
-        elif (order_data.direction == Direction.BUY) and (isinstance(order_data, LimitOrderBody)):
-            cost = order_data.qty * order_data.price
-            avail_rub = await get_available_balance(user_id, "RUB", db)
-            if avail_rub < cost:
-                raise HTTPException(status_code=400, detail="Insufficient 'RUB' balance for order")
-            await reserve_balance(user_id, "RUB", cost, db)
-
-        elif (order_data.direction == Direction.BUY) and (isinstance(order_data, MarketOrderBody)):
-            max_price = await get_max_price_for_market_rub_reserve(order_data.ticker, db)
-            if max_price is None:
-                raise HTTPException(status_code=400, detail="No liquidity to estimate market order cost")
-            cost = order_data.qty * max_price
-            avail_rub = await get_available_balance(user_id, "RUB", db)
-            if avail_rub < cost:
-                raise HTTPException(status_code=400, detail="Insufficient 'RUB' balance for order")
-            await reserve_balance(user_id, "RUB", cost, db)
-
-        if isinstance(order_data, MarketOrderBody):
-            db_order = await create_order_in_db(order_data=order_data, price=None, user_id=user_id, db=db)
-            executed_order = await execute_market_order(db_order, max_price, db=db)
-            # if order_data.direction == Direction.SELL:
-            #     executed_order = await execute_market_sell_order(db_order, db)
-            # else:
-            #     executed_order = await execute_market_buy_order(db_order, db)
-        else:
-            db_order = await create_order_in_db(order_data=order_data, price=order_data.price, user_id=user_id, db=db)
-            executed_order = await execute_limit_order(db_order, db=db)
-
-        await db.commit()
-        await db.refresh(executed_order)
+        async with ticker_lock(order_data.ticker):
+            executed_order = await persist(
+                db, "create_order", lambda db: place_order(order_data, user_id, db)
+            )
+        mark_orderbook_dirty(order_data.ticker)
+        invalidate_market_data(order_data.ticker)
+        if executed_order.type == OrderType.MARKET and executed_order.status == OrderStatus.CANCELLED:
+            raise HTTPException(status_code=400, detail="No matching orders in the orderbook")
         return CreateOrderResponse(order_id=executed_order.id)
 
     except HTTPException:
@@ -125,11 +103,16 @@ async def create_order(
     summary=summary_tags["list_orders"]
 )
 async def list_orders(
+        ticker: Optional[str] = None,
+        after: Optional[int] = Query(None, ge=0),
         authorization: str = Depends(api_key_header),
-        db: AsyncSession = Depends(get_db)
+        db: AsyncSession = Depends(get_read_db)
 ):
     if not authorization:
         raise HTTPException(status_code=401, detail="Unauthorized")
+    if after is not None and ticker is None:
+        # Event sequence numbers are per ticker
+        raise HTTPException(status_code=400, detail="Ticker must be provided with 'after'")
 
     try:
         api_key = get_api_key(authorization)
@@ -137,8 +120,8 @@ async def list_orders(
         if auth_user is None:
             raise HTTPException(status_code=401, detail="Unauthorized")
 
-        orders = await get_orders_by_user(auth_user.id, db)
-        return [create_order_dict(order) for order in orders]
+        orders = await get_order_rows_by_user(auth_user.id, db, ticker, after)
+        return FastJSONResponse(order_rows(orders))
 
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -176,6 +159,59 @@ async def get_order(
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.get(
+    path="/api/v1/order/{order_id}/wait",
+    tags=["order"],
+    response_model=Union[LimitOrder, MarketOrder],
+    summary=summary_tags["wait_order"]
+)
+async def wait_order(
+        order_id: str,
+        after: Optional[int] = Query(None, ge=0),
+        timeout: float = Query(ORDER_WAIT_TIMEOUT, gt=0, le=ORDER_WAIT_MAX_TIMEOUT),
+        authorization: str = Depends(api_key_header),
+        db: AsyncSession = Depends(get_db)
+):
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    try:
+        api_key = get_api_key(authorization)
+        auth_user = await get_user_by_api_key(UUID(api_key), db)
+        if auth_user is None:
+            raise HTTPException(status_code=401, detail="Unauthorized")
+
+        order_uuid = UUID(order_id)
+        # Subscribe before reading the order so a change in between is not missed
+        waiter = order_notifier.subscribe(order_uuid)
+        try:
+            db_order = await get_order_by_id(order_uuid, db)
+            if db_order is None:
+                raise HTTPException(status_code=404, detail="Order not found")
+            if auth_user.id != db_order.user_id:
+                raise HTTPException(status_code=403, detail="Forbidden")
+
+            # Answer once the order's seq passes after (its current seq by default) or on timeout
+            if after is None:
+                after = db_order.seq
+            if db_order.seq <= after and db_order.status not in (OrderStatus.EXECUTED, OrderStatus.CANCELLED):
+                # Give the connection back to the pool while waiting
+                await db.rollback()
+                await asyncio.wait([waiter], timeout=timeout)
+                db_order = await get_order_by_id(order_uuid, db)
+                if db_order is None:
+                    raise HTTPException(status_code=404, detail="Order not found")
+        finally:
+            order_notifier.unsubscribe(order_uuid, waiter)
+
+        return create_order_dict(db_order)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.delete(
     path="/api/v1/order/{order_id}",
     tags=["order"],
@@ -196,25 +232,49 @@ async def cancel_order(
         if auth_user is None:
             raise HTTPException(status_code=401, detail="Unauthorized")
 
-        db_order = await get_order_by_id(UUID(order_id), db)
-        if db_order is None:
-            raise HTTPException(status_code=404, detail="Order Not Found")
-        if auth_user.id != db_order.user_id:
-            raise HTTPException(status_code=403, detail="Forbidden")
-        if db_order.status in [OrderStatus.EXECUTED, OrderStatus.CANCELLED]:
-            raise HTTPException(status_code=400, detail=f"Order Is Already {db_order.status}")
-
-        unfilled_qty = db_order.qty - db_order.filled
-        if unfilled_qty > 0:
-            if db_order.direction == Direction.BUY:
-                refund = unfilled_qty * db_order.price
-                await reserve_balance(db_order.user_id, "RUB", -refund, db)
-            else:
-                await reserve_balance(db_order.user_id, db_order.ticker, -unfilled_qty, db)
-
-        db_order.status = OrderStatus.CANCELLED
-        await db.commit()
+        user_id = auth_user.id
+        cancelled_order = await persist(db, "cancel_order", lambda db: cancel_user_order(UUID(order_id), user_id, db))
+        mark_orderbook_dirty(cancelled_order.ticker)
+        invalidate_market_data(cancelled_order.ticker)
         return Ok()
 
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get(
+    path="/api/v1/executions",
+    tags=["order"],
+    response_class=StreamingResponse,
+    responses={200: {"model": Execution, "description": "NDJSON stream, one execution report per line"}},
+    summary=summary_tags["stream_executions"]
+)
+async def stream_executions(
+        after: Optional[str] = Query(
+            None,
+            pattern=r"^[A-Z]{2,10}:\d+(,[A-Z]{2,10}:\d+)*$",
+            description="Last received seq per ticker, e.g. MEM:12,ABC:7"
+        ),
+        authorization: str = Depends(api_key_header),
+        db: AsyncSession = Depends(get_db)
+):
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    try:
+        api_key = get_api_key(authorization)
+        auth_user = await get_user_by_api_key(UUID(api_key), db)
+        if auth_user is None:
+            raise HTTPException(status_code=401, detail="Unauthorized")
+
+        # Without after the stream starts from now
+        cursor = parse_fill_cursor(after) if after is not None else await get_fill_cursor(auth_user.id, db)
+        user_id = auth_user.id
+        await db.rollback()
+
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(execution_stream(user_id, cursor), media_type="application/x-ndjson")
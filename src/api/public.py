@@ -1,29 +1,32 @@
 # src/api/public.py
 from fastapi import APIRouter, HTTPException, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import Dict, List, Optional
 
-from src.schemas.schemas import NewUser, User, Instrument, L2OrderBook, Transaction
+from src.schemas.schemas import NewUser, User, Instrument, L2OrderBook, DepthOrderBook, Transaction
 from src.utils import (
-    check_username,
     get_all_instruments,
     get_instrument_by_ticker,
     register_new_user,
-    aggregate_orders,
+    aggregate_levels,
     get_bids,
     get_asks,
+    get_orderbooks,
+    get_resting_quantities,
     get_transactions_by_ticker
 )
-from src.database.database import get_db
-
-from sqlalchemy import delete
-from src.models.order import OrderModel
+from src.database.database import get_db, get_read_db
+from src.depth import aggregate_depth
+from src.serialization import FastJSONResponse, transaction_rows
+from src.snapshots import read_orderbook_snapshot
 
 
 summary_tags = {
     "register": "Register",
     "list_instruments": "List Instruments",
     "get_orderbook": "Get Orderbook",
+    "get_orderbooks": "Get Orderbooks",
+    "get_orderbook_depth": "Get Orderbook Depth",
     "get_transaction_history": "Get Transaction History"
 }
 
@@ -40,10 +43,6 @@ async def register(
         user: NewUser,
         db: AsyncSession = Depends(get_db)
 ):
-    if await check_username(user.name, db) is not None:
-        raise HTTPException(status_code=409, detail="Username already exists")
-    await db.execute(delete(OrderModel))
-    await db.commit()
     return await register_new_user(user, db)
 
 
@@ -53,10 +52,32 @@ async def register(
     response_model=List[Instrument],
     summary=summary_tags["list_instruments"]
 )
-async def list_instruments(db: AsyncSession = Depends(get_db)):
+async def list_instruments(db: AsyncSession = Depends(get_read_db)):
     return await get_all_instruments(db)
 
 
+@router.get(
+    path="/api/v1/public/orderbook",
+    tags=["public"],
+    response_model=Dict[str, L2OrderBook],
+    summary=summary_tags["get_orderbooks"]
+)
+async def get_orderbooks_batch(
+        tickers: Optional[List[str]] = Query(None),
+        depth: int = Query(10, ge=1, le=25),
+        db: AsyncSession = Depends(get_read_db)
+):
+    # No tickers means every instrument
+    known = {instrument.ticker for instrument in await get_all_instruments(db)}
+    if tickers is None:
+        tickers = sorted(known)
+    for ticker in tickers:
+        if ticker not in known:
+            raise HTTPException(status_code=404, detail=f"Ticker '{ticker}' Not Found")
+
+    return FastJSONResponse(await get_orderbooks(list(dict.fromkeys(tickers)), depth, db))
+
+
 @router.get(
     path="/api/v1/public/orderbook/{ticker}",
     tags=["public"],
@@ -66,8 +87,12 @@ async def list_instruments(db: AsyncSession = Depends(get_db)):
 async def get_orderbook(
         ticker: str,
         limit: int = Query(10, ge=1, le=25),
-        db: AsyncSession = Depends(get_db)
+        db: AsyncSession = Depends(get_read_db)
 ):
+    snapshot = read_orderbook_snapshot(ticker, limit)
+    if snapshot is not None:
+        return FastJSONResponse(snapshot)
+
     instrument = await get_instrument_by_ticker(ticker, db)
     if instrument is None:
         raise HTTPException(status_code=404, detail=f"Ticker '{ticker}' Not Found")
@@ -75,10 +100,31 @@ async def get_orderbook(
     bids = await get_bids(ticker, limit, db)
     asks = await get_asks(ticker, limit, db)
 
-    bid_levels = aggregate_orders(bids, is_bid=True)
-    ask_levels = aggregate_orders(asks, is_bid=False)
+    return FastJSONResponse({
+        "bid_levels": aggregate_levels(bids, is_bid=True),
+        "ask_levels": aggregate_levels(asks, is_bid=False)
+    })
+
+
+@router.get(
+    path="/api/v1/public/orderbook/{ticker}/depth",
+    tags=["public"],
+    response_model=DepthOrderBook,
+    summary=summary_tags["get_orderbook_depth"]
+)
+async def get_orderbook_depth(
+        ticker: str,
+        group: int = Query(1, ge=1),
+        depth: Optional[int] = Query(None, ge=1),
+        db: AsyncSession = Depends(get_read_db)
+):
+    # Full depth by default; group merges levels into price steps of that size
+    instrument = await get_instrument_by_ticker(ticker, db)
+    if instrument is None:
+        raise HTTPException(status_code=404, detail=f"Ticker '{ticker}' Not Found")
 
-    return L2OrderBook(bid_levels=bid_levels, ask_levels=ask_levels)
+    is_bid, prices, qtys = await get_resting_quantities(ticker, db)
+    return FastJSONResponse(aggregate_depth(is_bid, prices, qtys, group, depth))
 
 
 @router.get(
@@ -90,22 +136,15 @@ async def get_orderbook(
 async def get_transaction_history(
     ticker: str,
     limit: int = Query(10, ge=1, le=100), 
-    db: AsyncSession = Depends(get_db)
+    after: Optional[int] = Query(None, ge=0),
+    db: AsyncSession = Depends(get_read_db)
 ):
     instrument = await get_instrument_by_ticker(ticker, db)
     if instrument is None:
         raise HTTPException(status_code=404, detail=f"Ticker {ticker} not found")
 
-    transactions = await get_transactions_by_ticker(ticker, limit, db)
-    if (transactions is None) or (len(transactions) == 0):
+    transactions = await get_transactions_by_ticker(ticker, limit, db, after)
+    if after is None and ((transactions is None) or (len(transactions) == 0)):
         raise HTTPException(status_code=404, detail=f"No transactions found for ticker {ticker}")
 
-    return [
-        Transaction(
-            ticker=tx.ticker,
-            amount=tx.qty,
-            price=tx.price,
-            timestamp=tx.timestamp
-        )
-        for tx in transactions
-    ]
+    return FastJSONResponse(transaction_rows(transactions))
@@ -0,0 +1,130 @@
+# src/archive.py
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, any_, bindparam, column, func, insert, literal, table
+from sqlalchemy.dialects.postgresql import ARRAY, UUID, aggregate_order_by, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from src.database.partitions import (
+    ensure_monthly_partitions,
+    list_partitions,
+    detach_partition,
+    partition_month,
+    month_start,
+    next_month
+)
+from src.logger import logger
+from src.models.candle import CandleModel
+from src.models.order import OrderModel, OrderHistoryModel
+from src.models.transaction import TransactionModel
+from src.schemas.schemas import OrderStatus
+
+
+ORDER_ARCHIVE_INTERVAL = float(os.getenv("ORDER_ARCHIVE_INTERVAL", "5"))
+ORDER_ARCHIVE_BATCH_SIZE = int(os.getenv("ORDER_ARCHIVE_BATCH_SIZE", "5000"))
+
+TRANSACTIONS_MAINTENANCE_INTERVAL = float(os.getenv("TRANSACTIONS_MAINTENANCE_INTERVAL", "3600"))
+# Monthly partitions to create ahead of time
+TRANSACTIONS_PARTITIONS_AHEAD = int(os.getenv("TRANSACTIONS_PARTITIONS_AHEAD", "2"))
+# 0 keeps trades forever
+TRANSACTIONS_RETENTION_MONTHS = int(os.getenv("TRANSACTIONS_RETENTION_MONTHS", "0"))
+# "detach" keeps the detached table for export, "drop" deletes it
+TRANSACTIONS_RETENTION_MODE = os.getenv("TRANSACTIONS_RETENTION_MODE", "detach")
+CANDLE_INTERVAL = os.getenv("CANDLE_INTERVAL", "hour")
+
+TERMINAL_STATUSES = [OrderStatus.EXECUTED, OrderStatus.CANCELLED]
+
+
+async def archive_order_batch(db: AsyncSession) -> int:
+    result = await db.execute(
+        select(OrderModel.id, OrderModel.timestamp)
+        .where(OrderModel.status.in_(TERMINAL_STATUSES))
+        .limit(ORDER_ARCHIVE_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    )
+    rows = result.all()
+    if not rows:
+        return 0
+
+    await ensure_monthly_partitions(OrderHistoryModel.__tablename__, [row.timestamp for row in rows])
+
+    orders = OrderModel.__table__
+    columns = [c.name for c in orders.columns]
+    moved = (
+        orders.delete()
+        .where(
+            and_(
+                orders.c.id == any_(bindparam("ids", [row.id for row in rows], type_=ARRAY(UUID(as_uuid=True)))),
+                orders.c.status.in_(TERMINAL_STATUSES)
+            )
+        )
+        .returning(*orders.columns)
+        .cte("moved")
+    )
+    await db.execute(
+        insert(OrderHistoryModel.__table__)
+        .from_select(columns, select(*[moved.c[name] for name in columns]))
+    )
+    await db.commit()
+    return len(rows)
+
+
+async def archive_orders(db: AsyncSession):
+    total = 0
+    while True:
+        moved = await archive_order_batch(db)
+        total += moved
+        if moved < ORDER_ARCHIVE_BATCH_SIZE:
+            break
+    if total:
+        logger.info(f"Archived {total} terminal orders")
+
+
+async def rollup_candles(partition: str, db: AsyncSession):
+    trades = table(partition, column("id"), column("ticker"), column("price"), column("qty"), column("timestamp"))
+    start = func.date_trunc(CANDLE_INTERVAL, trades.c.timestamp)
+    await db.execute(
+        pg_insert(CandleModel)
+        .from_select(
+            ["ticker", "interval", "start", "open", "high", "low", "close", "volume", "trades"],
+            select(
+                trades.c.ticker,
+                literal(CANDLE_INTERVAL),
+                start,
+                func.array_agg(aggregate_order_by(trades.c.price, trades.c.timestamp, trades.c.id))[1],
+                func.max(trades.c.price),
+                func.min(trades.c.price),
+                func.array_agg(aggregate_order_by(trades.c.price, trades.c.timestamp.desc(), trades.c.id.desc()))[1],
+                func.sum(trades.c.qty),
+                func.count()
+            )
+            .group_by(trades.c.ticker, start)
+        )
+        .on_conflict_do_nothing()
+    )
+
+
+async def maintain_transactions(db: AsyncSession):
+    this_month = month_start(datetime.now(timezone.utc))
+    months = [this_month]
+    for _ in range(TRANSACTIONS_PARTITIONS_AHEAD):
+        months.append(next_month(months[-1]))
+    await ensure_monthly_partitions(TransactionModel.__tablename__, months)
+
+    if TRANSACTIONS_RETENTION_MONTHS <= 0:
+        return
+
+    cutoff = this_month
+    for _ in range(TRANSACTIONS_RETENTION_MONTHS):
+        cutoff = (cutoff - timedelta(days=1)).replace(day=1)
+
+    for partition in await list_partitions(TransactionModel.__tablename__, db):
+        month = partition_month(TransactionModel.__tablename__, partition)
+        if month is None or next_month(month) > cutoff:
+            continue
+        await rollup_candles(partition, db)
+        await detach_partition(TransactionModel.__tablename__, partition, TRANSACTIONS_RETENTION_MODE == "drop", db)
+        await db.commit()
+        logger.info(f"Transactions partition {partition} rolled up into candles and detached")
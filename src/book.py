@@ -0,0 +1,193 @@
+# src/book.py
+import bisect
+from array import array
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from src.matching import match_all, match_steps, order_status
+from src.models.order import OrderModel, OrderType
+from src.schemas.schemas import Direction, TimeInForce
+
+
+# (order_id, user_id, qty, price, seq) of a maker's filled part; seq is None when no numbers were issued
+Fill = Tuple[UUID, UUID, int, int, Optional[int]]
+
+
+class OrderBook:
+    """In-memory book for one ticker: order fields live in column arrays and an order is an integer handle.
+
+    No Python object is created per order, so a million orders take about a hundred megabytes
+    and don't load the garbage collector. Orders become OrderModel only at the DB boundary.
+    """
+
+    def __init__(self, ticker: str):
+        self.ticker = ticker
+        self.price = array("q")
+        self.qty = array("q")
+        self.filled = array("q")
+        self.entry_seq = array("q")
+        self.seq = array("q")
+        self.timestamp = array("d")
+        self.is_bid = array("b")
+        self.ids = bytearray()
+        self.user_ids = bytearray()
+        self._free = array("q")
+        # Executed orders have left the book, but their handles stay taken until their state is written
+        self._executed = array("q")
+        self._handles: Dict[int, int] = {}
+        # Per-level handle queues in entry_seq order; level prices are sorted ascending
+        self._levels: Tuple[Dict[int, array], Dict[int, array]] = ({}, {})
+        self._prices: Tuple[List[int], List[int]] = ([], [])
+
+    def __len__(self) -> int:
+        return len(self._handles)
+
+    def add(self, order_id: UUID, user_id: UUID, is_bid: bool, price: int, qty: int,
+            filled: int = 0, entry_seq: int = 0, seq: int = 0, timestamp: float = 0.0) -> int:
+        if self._free:
+            handle = self._free.pop()
+            self.price[handle] = price
+            self.qty[handle] = qty
+            self.filled[handle] = filled
+            self.entry_seq[handle] = entry_seq
+            self.seq[handle] = seq
+            self.timestamp[handle] = timestamp
+            self.is_bid[handle] = is_bid
+            self.ids[handle * 16:handle * 16 + 16] = order_id.bytes
+            self.user_ids[handle * 16:handle * 16 + 16] = user_id.bytes
+        else:
+            handle = len(self.price)
+            self.price.append(price)
+            self.qty.append(qty)
+            self.filled.append(filled)
+            self.entry_seq.append(entry_seq)
+            self.seq.append(seq)
+            self.timestamp.append(timestamp)
+            self.is_bid.append(is_bid)
+            self.ids += order_id.bytes
+            self.user_ids += user_id.bytes
+        self._handles[order_id.int] = handle
+
+        levels, prices = self._levels[is_bid], self._prices[is_bid]
+        level = levels.get(price)
+        if level is None:
+            level = levels[price] = array("q")
+            bisect.insort(prices, price)
+        if level and self.entry_seq[level[-1]] > entry_seq:
+            # Out-of-priority insert: put the order in its place
+            seqs = [self.entry_seq[h] for h in level]
+            level.insert(bisect.bisect(seqs, entry_seq), handle)
+        else:
+            level.append(handle)
+        return handle
+
+    def add_model(self, order: OrderModel) -> int:
+        return self.add(
+            order.id, order.user_id, order.direction == Direction.BUY, order.price, order.qty,
+            order.filled, order.entry_seq, order.seq, order.timestamp.timestamp()
+        )
+
+    def handle(self, order_id: UUID) -> Optional[int]:
+        return self._handles.get(order_id.int)
+
+    def order_id(self, handle: int) -> UUID:
+        return UUID(bytes=bytes(self.ids[handle * 16:handle * 16 + 16]))
+
+    def user_id(self, handle: int) -> UUID:
+        return UUID(bytes=bytes(self.user_ids[handle * 16:handle * 16 + 16]))
+
+    def remaining(self, handle: int) -> int:
+        return self.qty[handle] - self.filled[handle]
+
+    def to_model(self, handle: int) -> OrderModel:
+        """Unsaved OrderModel with the order's current state, for writing to the DB."""
+        return OrderModel(
+            id=self.order_id(handle),
+            status=order_status(self.qty[handle], self.filled[handle]),
+            user_id=self.user_id(handle),
+            timestamp=datetime.fromtimestamp(self.timestamp[handle], timezone.utc),
+            direction=Direction.BUY if self.is_bid[handle] else Direction.SELL,
+            ticker=self.ticker,
+            qty=self.qty[handle],
+            price=self.price[handle],
+            filled=self.filled[handle],
+            time_in_force=TimeInForce.GTC,
+            entry_seq=self.entry_seq[handle],
+            seq=self.seq[handle],
+            type=OrderType.LIMIT
+        )
+
+    def _unlink(self, handle: int):
+        is_bid, price = bool(self.is_bid[handle]), self.price[handle]
+        levels = self._levels[is_bid]
+        level = levels[price]
+        level.remove(handle)
+        if not level:
+            del levels[price]
+            prices = self._prices[is_bid]
+            del prices[bisect.bisect_left(prices, price)]
+        del self._handles[int.from_bytes(self.ids[handle * 16:handle * 16 + 16], "big")]
+
+    def remove(self, handle: int):
+        self._unlink(handle)
+        self._free.append(handle)
+
+    def fill(self, handle: int, qty: int, seq: Optional[int] = None):
+        """Fills part of the order; without seq the order's last event number is unchanged."""
+        self.filled[handle] += qty
+        if seq is not None:
+            self.seq[handle] = seq
+        if self.filled[handle] >= self.qty[handle]:
+            self._unlink(handle)
+            self._executed.append(handle)
+
+    def pop_executed(self) -> List[OrderModel]:
+        """Executed orders to write to the DB; their handles are free again afterwards."""
+        models = [self.to_model(handle) for handle in self._executed]
+        self.release_executed()
+        return models
+
+    def release_executed(self):
+        """Frees executed orders' handles without writing them, when state is not persisted."""
+        self._free.extend(self._executed)
+        del self._executed[:]
+
+    def best_price(self, is_bid: bool) -> Optional[int]:
+        prices = self._prices[is_bid]
+        if not prices:
+            return None
+        return prices[-1] if is_bid else prices[0]
+
+    def resting(self, is_bid: bool) -> Iterator[int]:
+        """Handles of one side in priority order; the book must not change while iterating."""
+        prices = self._prices[is_bid]
+        for price in (reversed(prices) if is_bid else prices):
+            yield from self._levels[is_bid][price]
+
+    def match(self, is_bid: bool, price: Optional[int], qty: int,
+              next_seq: Optional[Callable[[], int]] = None) -> List[Fill]:
+        """Matches an incoming order by the src.matching rules without checking makers' funds; price=None is market.
+
+        next_seq numbers each trade like next_sequence in the DB. Fully executed makers wait in
+        pop_executed/release_executed until their state is persisted.
+        """
+        resting = ((handle, self.price[handle], self.remaining(handle)) for handle in self.resting(not is_bid))
+        # Collect trades before touching the book: resting can't be iterated while levels change
+        trades, _ = match_all(match_steps(is_bid, price, qty, resting))
+        fills: List[Fill] = []
+        for handle, trade_qty, trade_price in trades:
+            seq = next_seq() if next_seq is not None else None
+            fills.append((self.order_id(handle), self.user_id(handle), trade_qty, trade_price, seq))
+            self.fill(handle, trade_qty, seq)
+        return fills
+
+    def levels(self, is_bid: bool, depth: Optional[int] = None) -> List[dict]:
+        prices = self._prices[is_bid]
+        ordered = reversed(prices) if is_bid else iter(prices)
+        result = []
+        for price in ordered:
+            if depth is not None and len(result) >= depth:
+                break
+            result.append({"price": price, "qty": sum(self.remaining(h) for h in self._levels[is_bid][price])})
+        return result
@@ -1,11 +1,28 @@
 # src/database/database.py
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 from typing import AsyncGenerator
+import asyncio
 import os
 
+from src.logger import logger
+from src.metrics import Gauge
+
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Replica for public and historical reads; defaults to a separate pool on the primary
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL") or DATABASE_URL
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", "10"))
+READ_MAX_OVERFLOW = int(os.getenv("READ_MAX_OVERFLOW", "10"))
+# Reads go to the primary while the replica lags more than this; 0 disables the check
+READ_MAX_LAG_SECONDS = float(os.getenv("READ_MAX_LAG_SECONDS", "5"))
+READ_LAG_CHECK_INTERVAL = float(os.getenv("READ_LAG_CHECK_INTERVAL", "1"))
+READ_LAG_CHECK_TIMEOUT = float(os.getenv("READ_LAG_CHECK_TIMEOUT", "1"))
+# Primary read pool for while the replica lags, separate from the order-entry pool
+READ_FALLBACK_POOL_SIZE = int(os.getenv("READ_FALLBACK_POOL_SIZE", "5"))
+READ_FALLBACK_MAX_OVERFLOW = int(os.getenv("READ_FALLBACK_MAX_OVERFLOW", "5"))
+REPLICA_LAG_CHECK_ENABLED = READ_DATABASE_URL != DATABASE_URL and READ_MAX_LAG_SECONDS > 0
 
 async_engine = create_async_engine(
     DATABASE_URL,
@@ -14,15 +31,93 @@ async_engine = create_async_engine(
     pool_timeout=30,
 )
 
+read_engine = create_async_engine(
+    READ_DATABASE_URL,
+    pool_size=READ_POOL_SIZE,
+    max_overflow=READ_MAX_OVERFLOW,
+    pool_timeout=30,
+)
+
 AsyncSessionLocal = async_sessionmaker(
     bind=async_engine,
     class_=AsyncSession,
     expire_on_commit=False
 )
 
+ReadSessionLocal = async_sessionmaker(
+    bind=read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False
+)
+
+# Without a replica reads already have their own pool on the primary
+fallback_read_engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=READ_FALLBACK_POOL_SIZE,
+    max_overflow=READ_FALLBACK_MAX_OVERFLOW,
+    pool_timeout=30,
+    connect_args={"server_settings": {"default_transaction_read_only": "on"}},
+) if REPLICA_LAG_CHECK_ENABLED else read_engine
+
+FallbackReadSessionLocal = async_sessionmaker(
+    bind=fallback_read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
+replica_lag_seconds = Gauge(
+    "db_replica_lag_seconds",
+    "Replay lag of the read replica; 0 when caught up or reading from the primary"
+)
+
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+# Read from the primary until the first check so an unreachable replica can't stall early requests
+_replica_state = {"fresh": False}
+
+
+async def _replica_lag() -> float:
+    async with read_engine.connect() as conn:
+        lag = (await conn.execute(REPLICA_LAG_SQL)).scalar()
+    return float(lag or 0)
+
+
+async def check_replica_lag(db: AsyncSession):
+    """Periodic task; db is unused because the lag is read from the replica itself."""
+    try:
+        # An unreachable replica must not hold the check past the timeout
+        lag = await asyncio.wait_for(_replica_lag(), READ_LAG_CHECK_TIMEOUT)
+        replica_lag_seconds.set(value=lag)
+        fresh = lag <= READ_MAX_LAG_SECONDS
+    except Exception:
+        logger.exception("Replica lag check failed")
+        fresh = False
+    if fresh and not _replica_state["fresh"]:
+        logger.warning("Read replica caught up, routing reads back to it")
+    elif not fresh and _replica_state["fresh"]:
+        logger.warning("Read replica is behind READ_MAX_LAG_SECONDS, routing reads to the primary")
+    _replica_state["fresh"] = fresh
+
+
+def replica_is_fresh() -> bool:
+    return not REPLICA_LAG_CHECK_ENABLED or _replica_state["fresh"]
+
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
         yield session
+
+
+def read_session() -> AsyncSession:
+    return (ReadSessionLocal if replica_is_fresh() else FallbackReadSessionLocal)()
+
+
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    async with read_session() as session:
+        yield session
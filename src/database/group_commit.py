@@ -0,0 +1,167 @@
+# src/database/group_commit.py
+import asyncio
+import os
+from typing import Awaitable, Callable, List, Optional, TypeVar
+
+from fastapi import HTTPException
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.database import AsyncSessionLocal
+from src.database.retry import (
+    run_transaction,
+    get_sqlstate,
+    retries_total,
+    retries_exhausted_total,
+    RETRYABLE_SQLSTATES,
+    DB_RETRY_ATTEMPTS
+)
+from src.logger import logger
+from src.metrics import Counter
+
+
+# "request" commits each order in its own transaction, "group" batches them into one commit
+ORDER_PERSISTENCE = os.getenv("ORDER_PERSISTENCE", "request")
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "2"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "128"))
+
+group_commits_total = Counter(
+    "group_commits_total",
+    "Transactions committed by the group committer"
+)
+group_commit_units_total = Counter(
+    "group_commit_units_total",
+    "Units of work applied by the group committer",
+    ("outcome",)
+)
+
+T = TypeVar("T")
+
+
+class _Unit:
+    __slots__ = ("operation", "fn", "future")
+
+    def __init__(self, operation: str, fn: Callable[[AsyncSession], Awaitable], future: asyncio.Future):
+        self.operation = operation
+        self.fn = fn
+        self.future = future
+
+
+class GroupCommitter:
+    """Collects units of work from concurrent requests and commits them in one transaction."""
+
+    def __init__(self, window: float, max_batch: int):
+        self.window = window
+        self.max_batch = max_batch
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run(), name="group_commit")
+
+    async def stop(self):
+        if self.task is None:
+            return
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+        while not self.queue.empty():
+            unit = self.queue.get_nowait()
+            if not unit.future.done():
+                unit.future.set_exception(HTTPException(status_code=503, detail="Service is shutting down"))
+
+    async def submit(self, operation: str, fn: Callable[[AsyncSession], Awaitable[T]]) -> T:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(_Unit(operation, fn, future))
+        return await future
+
+    async def _collect(self) -> List[_Unit]:
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return [unit for unit in batch if not unit.future.cancelled()]
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+            try:
+                await self._commit_batch(batch)
+            except asyncio.CancelledError:
+                self._fail(batch, HTTPException(status_code=503, detail="Service is shutting down"))
+                raise
+            except Exception as e:
+                logger.exception("Group commit failed")
+                self._fail(batch, e)
+
+    @staticmethod
+    async def _apply(unit: _Unit, db: AsyncSession):
+        # Each unit runs in its own SAVEPOINT so one failing order doesn't roll back the rest
+        try:
+            async with db.begin_nested():
+                return True, await unit.fn(db)
+        except DBAPIError as e:
+            reason = RETRYABLE_SQLSTATES.get(get_sqlstate(e))
+            if reason is None:
+                return False, e
+            retries_exhausted_total.inc(unit.operation, reason)
+            return False, HTTPException(status_code=503, detail="Transaction aborted due to contention, retry later")
+        except Exception as e:
+            return False, e
+
+    async def _commit_batch(self, batch: List[_Unit]):
+        attempt = 0
+        while True:
+            attempt += 1
+            async with AsyncSessionLocal() as db:
+                try:
+                    outcomes = [await self._apply(unit, db) for unit in batch]
+                    await db.commit()
+                except DBAPIError as e:
+                    await db.rollback()
+                    reason = RETRYABLE_SQLSTATES.get(get_sqlstate(e))
+                    if reason is None or attempt >= DB_RETRY_ATTEMPTS:
+                        raise
+                    retries_total.inc("group_commit", reason)
+                    continue
+
+            group_commits_total.inc()
+            for unit, (ok, value) in zip(batch, outcomes):
+                group_commit_units_total.inc("ok" if ok else "error")
+                if unit.future.done():
+                    continue
+                if ok:
+                    unit.future.set_result(value)
+                else:
+                    unit.future.set_exception(value)
+            return
+
+    @staticmethod
+    def _fail(batch: List[_Unit], exc: BaseException):
+        for unit in batch:
+            if not unit.future.done():
+                unit.future.set_exception(exc)
+
+
+group_committer = GroupCommitter(GROUP_COMMIT_WINDOW_MS / 1000, GROUP_COMMIT_MAX_BATCH)
+
+
+async def persist(db: AsyncSession, operation: str, fn: Callable[[AsyncSession], Awaitable[T]]) -> T:
+    if ORDER_PERSISTENCE == "group":
+        # The request's transaction only read; release it while waiting for the group
+        await db.rollback()
+        return await group_committer.submit(operation, fn)
+    return await run_transaction(db, operation, fn)
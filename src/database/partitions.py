@@ -0,0 +1,69 @@
+# src/database/partitions.py
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.database import async_engine
+
+
+_known_partitions = set()
+
+
+def month_start(ts: datetime) -> datetime:
+    return datetime(ts.year, ts.month, 1, tzinfo=timezone.utc)
+
+
+def next_month(month: datetime) -> datetime:
+    if month.month == 12:
+        return month.replace(year=month.year + 1, month=1)
+    return month.replace(month=month.month + 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+async def ensure_monthly_partitions(table: str, timestamps: Iterable[datetime]):
+    # DDL runs on its own autocommit connection so a rolled-back caller
+    # can't leave a partition in _known_partitions that doesn't exist
+    months = {month_start(ts.astimezone(timezone.utc)) for ts in timestamps}
+    missing = [m for m in sorted(months) if partition_name(table, m) not in _known_partitions]
+    if not missing:
+        return
+
+    async with async_engine.begin() as conn:
+        # Processes may create the same partition concurrently; IF NOT EXISTS doesn't cover that race
+        await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:table))"), {"table": table})
+        for month in missing:
+            await conn.execute(text(
+                f'CREATE TABLE IF NOT EXISTS "{partition_name(table, month)}" PARTITION OF "{table}" '
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+            ))
+    _known_partitions.update(partition_name(table, m) for m in missing)
+
+
+def partition_month(table: str, name: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(name[len(table) + 1:], "%Y_%m").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+async def list_partitions(table: str, db: AsyncSession) -> List[str]:
+    result = await db.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:table AS regclass) ORDER BY c.relname"
+        ),
+        {"table": table}
+    )
+    return list(result.scalars().all())
+
+
+async def detach_partition(table: str, name: str, drop: bool, db: AsyncSession):
+    await db.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"'))
+    if drop:
+        await db.execute(text(f'DROP TABLE "{name}"'))
+    _known_partitions.discard(name)
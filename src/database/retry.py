@@ -0,0 +1,71 @@
+# src/database/retry.py
+import asyncio
+import os
+import random
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from fastapi import HTTPException
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.logger import logger
+from src.metrics import Counter
+from src.tracing import span
+
+
+DB_RETRY_ATTEMPTS = int(os.getenv("DB_RETRY_ATTEMPTS", "5"))
+DB_RETRY_BASE_DELAY = float(os.getenv("DB_RETRY_BASE_DELAY", "0.005"))
+DB_RETRY_MAX_DELAY = float(os.getenv("DB_RETRY_MAX_DELAY", "0.2"))
+
+RETRYABLE_SQLSTATES = {
+    "40P01": "deadlock",
+    "40001": "serialization"
+}
+
+retries_total = Counter(
+    "db_transaction_retries_total",
+    "Transactions restarted after a deadlock or serialization failure",
+    ("operation", "reason")
+)
+retries_exhausted_total = Counter(
+    "db_transaction_retries_exhausted_total",
+    "Transactions that still failed after DB_RETRY_ATTEMPTS attempts",
+    ("operation", "reason")
+)
+
+T = TypeVar("T")
+
+
+def get_sqlstate(exc: DBAPIError) -> Optional[str]:
+    orig = getattr(exc, "orig", None)
+    return getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)
+
+
+async def run_transaction(db: AsyncSession, operation: str, fn: Callable[[AsyncSession], Awaitable[T]]) -> T:
+    """Runs fn(db) and commits, retrying the whole transaction on deadlock or serialization failure."""
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            result = await fn(db)
+            with span("commit"):
+                await db.commit()
+            return result
+
+        except DBAPIError as e:
+            await db.rollback()
+            reason = RETRYABLE_SQLSTATES.get(get_sqlstate(e))
+            if reason is None:
+                raise
+            if attempt >= DB_RETRY_ATTEMPTS:
+                retries_exhausted_total.inc(operation, reason)
+                logger.warning(f"{operation}: giving up after {attempt} attempts ({reason})")
+                raise HTTPException(status_code=503, detail="Transaction aborted due to contention, retry later")
+
+            retries_total.inc(operation, reason)
+            delay = min(DB_RETRY_MAX_DELAY, DB_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+            await asyncio.sleep(random.uniform(0, delay))
+
+        except BaseException:
+            await db.rollback()
+            raise
@@ -0,0 +1,43 @@
+# src/depth.py
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+def aggregate_side(prices: np.ndarray, qtys: np.ndarray, is_bid: bool, group: int, depth: Optional[int]) -> List[dict]:
+    keep = qtys > 0
+    prices, qtys = prices[keep], qtys[keep]
+    if prices.size == 0:
+        return []
+
+    if group > 1:
+        # Bids round down and asks round up so a level never promises a better price than it has
+        prices = prices // group * group if is_bid else -(-prices // group) * group
+
+    order = np.argsort(prices)
+    prices, qtys = prices[order], qtys[order]
+    starts = np.flatnonzero(np.concatenate(([True], prices[1:] != prices[:-1])))
+    levels = prices[starts]
+    sizes = np.add.reduceat(qtys, starts)
+    if is_bid:
+        levels, sizes = levels[::-1], sizes[::-1]
+    if depth is not None:
+        levels, sizes = levels[:depth], sizes[:depth]
+    totals = np.cumsum(sizes)
+
+    return [
+        {"price": price, "qty": qty, "total": total}
+        for price, qty, total in zip(levels.tolist(), sizes.tolist(), totals.tolist())
+    ]
+
+
+def aggregate_depth(is_bid: Optional[Sequence[bool]], prices: Optional[Sequence[int]], qtys: Optional[Sequence[int]],
+                    group: int = 1, depth: Optional[int] = None) -> dict:
+    """Resting limit-order columns for a ticker, or None when there are none -> levels with cumulative qty."""
+    is_bid = np.array(is_bid or (), dtype=bool)
+    prices = np.array(prices or (), dtype=np.int64)
+    qtys = np.array(qtys or (), dtype=np.int64)
+    return {
+        "bid_levels": aggregate_side(prices[is_bid], qtys[is_bid], True, group, depth),
+        "ask_levels": aggregate_side(prices[~is_bid], qtys[~is_bid], False, group, depth)
+    }
@@ -0,0 +1,166 @@
+# src/etags.py
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from src.metrics import Counter
+
+
+# Seconds a stored ETag is trusted without recomputing; changes from other workers
+# and replica lag show up within this window. 0 answers 304 only after recomputing
+ETAG_MAX_AGE = float(os.getenv("ETAG_MAX_AGE", "1"))
+ETAG_CACHE_SIZE = int(os.getenv("ETAG_CACHE_SIZE", "10000"))
+
+INSTRUMENTS_PATH = "/api/v1/public/instrument"
+MARKET_DATA_PATH = re.compile(r"^/api/v1/public/(?:orderbook|transactions)/([^/]+)(?:/depth)?$")
+INSTRUMENTS_RESOURCE = ""
+
+conditional_requests_total = Counter(
+    "conditional_get_requests_total",
+    "Public market-data GET requests by ETag outcome",
+    ("outcome",)
+)
+
+
+class ResourceVersions:
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._epoch = 0
+
+    def get(self, resource: str) -> Tuple[int, int]:
+        return self._epoch, self._versions.get(resource, 0)
+
+    def bump(self, resource: str):
+        self._versions[resource] = self._versions.get(resource, 0) + 1
+
+    def bump_all(self):
+        self._epoch += 1
+        self._versions.clear()
+
+
+class _Validator:
+    __slots__ = ("etag", "version", "expires_at")
+
+    def __init__(self, etag: bytes, version: Tuple[int, int], expires_at: float):
+        self.etag = etag
+        self.version = version
+        self.expires_at = expires_at
+
+
+class ValidatorCache:
+    """ETag of the last response per URL with the resource version it was computed for."""
+
+    def __init__(self, max_age: float, max_size: int):
+        self.max_age = max_age
+        self.max_size = max_size
+        self._entries: "OrderedDict[bytes, _Validator]" = OrderedDict()
+
+    def get(self, key: bytes, version: Tuple[int, int]) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.version != version or entry.expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry.etag
+
+    def put(self, key: bytes, etag: bytes, version: Tuple[int, int]):
+        self._entries[key] = _Validator(etag, version, time.monotonic() + self.max_age)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+versions = ResourceVersions()
+validators = ValidatorCache(ETAG_MAX_AGE, ETAG_CACHE_SIZE)
+
+
+def invalidate_market_data(ticker: str):
+    """Call after committing book or trade changes for the ticker."""
+    versions.bump(ticker)
+
+
+def invalidate_instruments():
+    versions.bump(INSTRUMENTS_RESOURCE)
+
+
+def invalidate_all():
+    versions.bump_all()
+
+
+def _matches(if_none_match: bytes, etag: bytes) -> bool:
+    if if_none_match.strip() == b"*":
+        return True
+    return any(tag.strip().removeprefix(b"W/") == etag for tag in if_none_match.split(b","))
+
+
+async def _not_modified(send, etag: bytes):
+    await send({"type": "http.response.start", "status": 304, "headers": [(b"etag", etag)]})
+    await send({"type": "http.response.body", "body": b""})
+
+
+class ConditionalGetMiddleware:
+    """Answers If-None-Match on public market data with 304 without opening a DB session."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+        if scope["path"] == INSTRUMENTS_PATH:
+            resource = INSTRUMENTS_RESOURCE
+        else:
+            match = MARKET_DATA_PATH.match(scope["path"])
+            if match is None:
+                await self.app(scope, receive, send)
+                return
+            resource = match.group(1)
+
+        key = scope["path"].encode() + b"?" + scope["query_string"]
+        version = versions.get(resource)
+        if_none_match = dict(scope["headers"]).get(b"if-none-match")
+
+        if if_none_match is not None:
+            etag = validators.get(key, version)
+            if etag is not None and _matches(if_none_match, etag):
+                conditional_requests_total.inc("not_modified_cached")
+                await _not_modified(send, etag)
+                return
+
+        start, chunks = None, []
+
+        async def capture(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                if message["status"] != 200:
+                    await send(message)
+                    return
+                start = message
+                return
+            if start is None:
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            etag = b'"' + hashlib.blake2b(body, digest_size=12).hexdigest().encode() + b'"'
+            # The version was read before the request, so a change during it leaves the entry stale
+            validators.put(key, etag, version)
+            if if_none_match is not None and _matches(if_none_match, etag):
+                conditional_requests_total.inc("not_modified")
+                await _not_modified(send, etag)
+                return
+            conditional_requests_total.inc("modified")
+            await send({**start, "headers": [*start.get("headers", []), (b"etag", etag)]})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, capture)
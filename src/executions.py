@@ -0,0 +1,83 @@
+# src/executions.py
+import asyncio
+from collections import deque
+from typing import Dict, List
+from uuid import UUID
+
+from src.database.database import AsyncSessionLocal
+from src.notifier import execution_feed, EXECUTIONS_BACKFILL_BATCH, EXECUTIONS_HEARTBEAT, EXECUTIONS_QUEUE_SIZE
+from src.serialization import dumps, fill_row
+from src.sharding import sharding_enabled
+from src.utils import get_fills_by_user
+
+
+def parse_fill_cursor(after: str) -> Dict[str, int]:
+    """Stream cursor 'MEM:12,ABC:7': the last received seq per ticker."""
+    cursor = {}
+    for part in after.split(","):
+        ticker, seq = part.split(":")
+        cursor[ticker] = int(seq)
+    return cursor
+
+
+class RecentIds:
+    """Recently sent ids: a live event may repeat a fill already backfilled from the DB."""
+
+    def __init__(self, size: int):
+        self._order = deque()
+        self._ids = set()
+        self.size = size
+
+    def add(self, fill_id: int):
+        self._order.append(fill_id)
+        self._ids.add(fill_id)
+        if len(self._order) > self.size:
+            self._ids.discard(self._order.popleft())
+
+    def __contains__(self, fill_id: int) -> bool:
+        return fill_id in self._ids
+
+
+async def fetch_fill_rows(user_id: UUID, after: Dict[str, int]) -> List[dict]:
+    async with AsyncSessionLocal() as db:
+        fills = await get_fills_by_user(user_id, after, EXECUTIONS_BACKFILL_BATCH, db)
+    return [fill_row(fill) for fill in fills]
+
+
+async def execution_stream(user_id: UUID, after: Dict[str, int]):
+    # Subscribe before the backfill so fills committed in between are not lost
+    subscription = execution_feed.subscribe(user_id)
+    delivered = RecentIds(EXECUTIONS_QUEUE_SIZE + EXECUTIONS_BACKFILL_BATCH)
+
+    def advance(row: dict):
+        after[row["ticker"]] = max(after.get(row["ticker"], 0), row["seq"])
+        delivered.add(row["id"])
+
+    try:
+        while True:
+            rows = await fetch_fill_rows(user_id, after)
+            for row in rows:
+                yield dumps(row) + b"\n"
+                advance(row)
+            if not rows:
+                break
+
+        while not (subscription.overflowed and subscription.queue.empty()):
+            try:
+                row = await asyncio.wait_for(subscription.queue.get(), EXECUTIONS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                if sharding_enabled():
+                    # Other workers' tickers trade there and are not published here
+                    for row in await fetch_fill_rows(user_id, after):
+                        if row["id"] not in delivered:
+                            yield dumps(row) + b"\n"
+                            advance(row)
+                yield b"\n"
+                continue
+            # No cursor filter here: commits on different tickers are published in any order
+            if row["id"] in delivered:
+                continue
+            yield dumps(row) + b"\n"
+            advance(row)
+    finally:
+        execution_feed.unsubscribe(user_id, subscription)
@@ -0,0 +1,144 @@
+# src/idempotency.py
+import asyncio
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from src.asgi import read_body, replay_body, send_json
+from src.metrics import Counter
+
+
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "3600"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "100000"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+REPLAYED_HEADER = b"idempotent-replayed"
+ORDER_PATH = "/api/v1/order"
+ORDER_ID_PATH = re.compile(r"^/api/v1/order/[^/]+$")
+
+idempotency_requests_total = Counter(
+    "idempotency_requests_total",
+    "Order requests carrying an Idempotency-Key, by outcome",
+    ("outcome",)
+)
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "expires_at", "response", "done")
+
+    def __init__(self, fingerprint: bytes, expires_at: float):
+        self.fingerprint = fingerprint
+        self.expires_at = expires_at
+        self.response: Optional[Tuple[int, List[Tuple[bytes, bytes]], bytes]] = None
+        self.done = asyncio.Event()
+
+
+class IdempotencyStore:
+    """Size-bounded response store with a TTL; the oldest keys are evicted first."""
+
+    def __init__(self, ttl: float, max_keys: int):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+
+    def get(self, key: tuple) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def reserve(self, key: tuple, fingerprint: bytes) -> _Entry:
+        entry = _Entry(fingerprint, time.monotonic() + self.ttl)
+        self._entries[key] = entry
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+        return entry
+
+    def discard(self, key: tuple, entry: _Entry):
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+
+
+store = IdempotencyStore(IDEMPOTENCY_TTL, IDEMPOTENCY_MAX_KEYS)
+
+
+class IdempotencyMiddleware:
+    """A retry with the same Idempotency-Key gets the stored response instead of running again."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (
+            (scope["method"] == "POST" and scope["path"] == ORDER_PATH)
+            or (scope["method"] == "DELETE" and ORDER_ID_PATH.match(scope["path"]))
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        idempotency_key = headers.get(IDEMPOTENCY_HEADER)
+        if idempotency_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not idempotency_key or len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            await send_json(send, 400, b'{"detail":"Invalid Idempotency-Key"}')
+            return
+
+        body = await read_body(receive)
+
+        key = (headers.get(b"authorization", b""), idempotency_key)
+        fingerprint = hashlib.sha256(scope["method"].encode() + b" " + scope["path"].encode() + b"\n" + body).digest()
+
+        while True:
+            entry = store.get(key)
+            if entry is None:
+                break
+            if entry.fingerprint != fingerprint:
+                idempotency_requests_total.inc("conflict")
+                await send_json(send, 422, b'{"detail":"Idempotency-Key was already used for a different request"}')
+                return
+            if not entry.done.is_set():
+                # The first request is still running: wait for its response instead of placing the order twice
+                idempotency_requests_total.inc("in_flight")
+                await entry.done.wait()
+            if entry.response is not None:
+                idempotency_requests_total.inc("replayed")
+                status, response_headers, response_body = entry.response
+                await send({"type": "http.response.start", "status": status,
+                            "headers": response_headers + [(REPLAYED_HEADER, b"true")]})
+                await send({"type": "http.response.body", "body": response_body})
+                return
+
+        idempotency_requests_total.inc("new")
+        entry = store.reserve(key, fingerprint)
+        status, response_headers, chunks = None, [], []
+        complete = False
+
+        async def capture(message):
+            nonlocal status, response_headers, complete
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                complete = not message.get("more_body", False)
+            await send(message)
+
+        try:
+            await self.app(scope, replay_body(body, receive), capture)
+        finally:
+            # Don't store 5xx or aborted requests so the client can retry them
+            if complete and status < 500:
+                entry.response = (status, response_headers, b"".join(chunks))
+            else:
+                store.discard(key, entry)
+            entry.done.set()
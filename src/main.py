@@ -4,6 +4,23 @@ from contextlib import asynccontextmanager
 
 from src.api import main_router
 from src.database.init_data import init_db
+from src.database.database import check_replica_lag, READ_LAG_CHECK_INTERVAL, REPLICA_LAG_CHECK_ENABLED
+from src.tracing import TracingMiddleware
+from src.tasks import start_periodic_task, stop_background_tasks
+from src.database.group_commit import group_committer, ORDER_PERSISTENCE
+from src.sharding import ShardForwardingMiddleware, is_leader, sharding_enabled
+from src.idempotency import IdempotencyMiddleware
+from src.admission import AdmissionMiddleware
+from src.etags import ConditionalGetMiddleware
+from src.snapshots import write_orderbook_snapshots, ORDERBOOK_SNAPSHOT_INTERVAL
+from src.striping import rebalance_stripes, HOT_ACCOUNT_REBALANCE_INTERVAL
+from src.reconcile import reconcile_reservations, RECONCILE_INTERVAL
+from src.archive import (
+    archive_orders,
+    maintain_transactions,
+    ORDER_ARCHIVE_INTERVAL,
+    TRANSACTIONS_MAINTENANCE_INTERVAL
+)
 
 
 global_tags = [
@@ -18,6 +35,9 @@ global_tags = [
     },
     {
         "name": "admin"
+    },
+    {
+        "name": "metrics"
     }
 ]
 
@@ -25,8 +45,28 @@ global_tags = [
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
+    start_periodic_task("rebalance_stripes", HOT_ACCOUNT_REBALANCE_INTERVAL, rebalance_stripes)
+    start_periodic_task("archive_orders", ORDER_ARCHIVE_INTERVAL, archive_orders)
+    start_periodic_task("maintain_transactions", TRANSACTIONS_MAINTENANCE_INTERVAL, maintain_transactions)
+    if is_leader():
+        start_periodic_task("reconcile_reservations", RECONCILE_INTERVAL, reconcile_reservations)
+    if REPLICA_LAG_CHECK_ENABLED:
+        start_periodic_task("replica_lag", READ_LAG_CHECK_INTERVAL, check_replica_lag)
+    if ORDER_PERSISTENCE == "group":
+        group_committer.start()
+    if sharding_enabled():
+        start_periodic_task("orderbook_snapshots", ORDERBOOK_SNAPSHOT_INTERVAL, write_orderbook_snapshots)
     yield
+    await group_committer.stop()
+    await stop_background_tasks()
 
 
 app = FastAPI(lifespan=lifespan, openapi_tags=global_tags)
 app.include_router(main_router)
+app.add_middleware(ConditionalGetMiddleware)
+app.add_middleware(IdempotencyMiddleware)
+if sharding_enabled():
+    # Inside admission: rejected clients never reach the order lookup
+    app.add_middleware(ShardForwardingMiddleware)
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(TracingMiddleware)
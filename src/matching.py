@@ -0,0 +1,95 @@
+# src/matching.py
+"""I/O-free matching rules.
+
+execute_limit_order/execute_market_order run them over DB orders and the replay over the in-memory book,
+so both see any rule change. Resting orders come as (key, price, available qty) triples in priority
+order: price, then entry_seq. The key is whatever the caller needs (an OrderModel, a book handle).
+"""
+from typing import Awaitable, Callable, Generator, Hashable, Iterable, List, Optional, Tuple, TypeVar
+
+from src.schemas.schemas import OrderStatus, TimeInForce
+
+
+K = TypeVar("K")
+# (resting order key, trade qty, trade price)
+Trade = Tuple[K, int, int]
+MatchSteps = Generator[Trade, bool, int]
+
+
+def crosses(is_buy: bool, limit_price: Optional[int], price: int) -> bool:
+    """Whether a resting price crosses; limit_price=None is a market order, which crosses any price."""
+    return limit_price is None or (price <= limit_price if is_buy else price >= limit_price)
+
+
+def has_liquidity(quantities: Iterable[int], qty: int) -> bool:
+    total = 0
+    for available in quantities:
+        total += available
+        if total >= qty:
+            return True
+    return qty <= 0
+
+
+def match_steps(is_buy: bool, limit_price: Optional[int], qty: int,
+                resting: Iterable[Tuple[K, int, int]]) -> MatchSteps:
+    """Proposes trades against resting orders in turn and returns the unfilled remainder.
+
+    The caller answers each proposal with send(True) when the trade went through and send(False)
+    when the resting order was skipped because its owner lacked funds.
+    """
+    remaining = qty
+    for key, price, available in resting:
+        if not crosses(is_buy, limit_price, price):
+            break
+        if available <= 0:
+            continue
+        trade_qty = min(remaining, available)
+        if (yield key, trade_qty, price):
+            remaining -= trade_qty
+            if remaining <= 0:
+                break
+    return remaining
+
+
+def match_all(steps: MatchSteps) -> Tuple[List[Trade], int]:
+    """Runs the steps accepting every trade, for when balances are not modelled."""
+    trades = []
+    try:
+        trade = next(steps)
+        while True:
+            trades.append(trade)
+            trade = steps.send(True)
+    except StopIteration as stop:
+        return trades, stop.value
+
+
+async def drive(steps: MatchSteps, settle: Callable[[Hashable, int, int], Awaitable[bool]]) -> int:
+    """Runs the steps, settling each trade through settle; returns the unfilled remainder."""
+    accepted = None
+    while True:
+        try:
+            trade = steps.send(accepted)
+        except StopIteration as stop:
+            return stop.value
+        accepted = await settle(*trade)
+
+
+def order_status(qty: int, filled: int) -> OrderStatus:
+    if filled >= qty:
+        return OrderStatus.EXECUTED
+    return OrderStatus.PARTIALLY_EXECUTED if filled else OrderStatus.NEW
+
+
+def resolve_order(is_market: bool, time_in_force: TimeInForce, qty: int, filled: int) -> Optional[OrderStatus]:
+    """Order status after walking the book; None means a FOK order fell short and is rejected whole.
+
+    CANCELLED means dropped without resting; the cancel gets its own event number.
+    """
+    if is_market:
+        # Market orders never rest, so a partial fill completes them too
+        return OrderStatus.EXECUTED if filled else OrderStatus.CANCELLED
+    if filled < qty and time_in_force == TimeInForce.FOK:
+        return None
+    if filled < qty and time_in_force == TimeInForce.IOC:
+        return OrderStatus.CANCELLED
+    return order_status(qty, filled)
@@ -0,0 +1,52 @@
+# src/metrics.py
+import threading
+from typing import Tuple
+
+
+_registry = []
+_lock = threading.Lock()
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with _lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, *labelvalues, value: float):
+        with _lock:
+            self.values[labelvalues] = value
+
+    def dec(self, *labelvalues, amount: float = 1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def remove(self, *labelvalues):
+        with _lock:
+            self.values.pop(labelvalues, None)
+
+
+def render_metrics() -> str:
+    lines = []
+    with _lock:
+        for metric in _registry:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for labelvalues, value in metric.values.items():
+                if labelvalues:
+                    labels = ",".join(f'{k}="{v}"' for k, v in zip(metric.labelnames, labelvalues))
+                    lines.append(f"{metric.name}{{{labels}}} {value}")
+                else:
+                    lines.append(f"{metric.name} {value}")
+    return "\n".join(lines) + "\n"
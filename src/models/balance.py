@@ -12,3 +12,13 @@ class BalanceModel(Base):
     instrument_ticker = Column(String, ForeignKey("instrument.ticker", ondelete="CASCADE"), index=True, primary_key=True)
     amount = Column(Integer, default=0)
     reserved = Column(Integer, default=0)
+
+
+class BalanceStripeModel(Base):
+    __tablename__ = "balance_stripe"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    instrument_ticker = Column(String, ForeignKey("instrument.ticker", ondelete="CASCADE"), primary_key=True)
+    stripe = Column(Integer, primary_key=True)
+    amount = Column(Integer, nullable=False, default=0)
+    reserved = Column(Integer, nullable=False, default=0)
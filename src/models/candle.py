@@ -0,0 +1,18 @@
+# src/models/candle.py
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+
+from src.database.database import Base
+
+
+class CandleModel(Base):
+    __tablename__ = "candles"
+
+    ticker = Column(String, ForeignKey("instrument.ticker", ondelete="CASCADE"), primary_key=True)
+    interval = Column(String, primary_key=True)
+    start = Column(DateTime(timezone=True), primary_key=True)
+    open = Column(Integer, nullable=False)
+    high = Column(Integer, nullable=False)
+    low = Column(Integer, nullable=False)
+    close = Column(Integer, nullable=False)
+    volume = Column(Integer, nullable=False)
+    trades = Column(Integer, nullable=False)
@@ -0,0 +1,26 @@
+# src/models/fill.py
+from sqlalchemy import Column, BigInteger, Integer, String, DateTime, ForeignKey, Index, Enum as SqlEnum
+from sqlalchemy.dialects.postgresql import UUID
+from datetime import datetime, timezone
+
+from src.schemas.schemas import Direction, Liquidity
+from src.database.database import Base
+
+
+class FillModel(Base):
+    __tablename__ = "fills"
+    __table_args__ = (
+        Index("ix_fills_user_id_id", "user_id", "id"),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    # No foreign key: executed orders move to orders_history
+    order_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+    ticker = Column(String, ForeignKey("instrument.ticker", ondelete="CASCADE"), nullable=False)
+    direction = Column(SqlEnum(Direction), nullable=False)
+    liquidity = Column(SqlEnum(Liquidity), nullable=False)
+    price = Column(Integer, nullable=False)
+    qty = Column(Integer, nullable=False)
+    seq = Column(BigInteger, nullable=False)
+    timestamp = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
@@ -1,5 +1,5 @@
 # src/models/instrument.py
-from sqlalchemy import Column, String
+from sqlalchemy import Column, String, BigInteger
 from sqlalchemy.orm import relationship
 
 from src.database.database import Base
@@ -10,6 +10,8 @@ class InstrumentModel(Base):
 
     name = Column(String, nullable=False, unique=True, index=True)
     ticker = Column(String, nullable=False, unique=True, index=True, primary_key=True)
+    # Last event sequence number issued for the ticker (orders, fills, cancels)
+    seq = Column(BigInteger, nullable=False, default=0, server_default="0")
 
     orders = relationship("OrderModel", backref="instrument", passive_deletes=True)
     balance = relationship("BalanceModel", backref="instrument", passive_deletes=True)
@@ -1,11 +1,11 @@
 # src/models/order.py
-from sqlalchemy import Column, String, Integer, ForeignKey, Enum as SqlEnum, DateTime
+from sqlalchemy import Column, String, Integer, BigInteger, ForeignKey, Enum as SqlEnum, DateTime
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 from datetime import datetime, timezone
 from enum import Enum
 
-from src.schemas.schemas import OrderStatus, Direction
+from src.schemas.schemas import OrderStatus, Direction, TimeInForce
 from src.database.database import Base
 
 
@@ -20,11 +20,35 @@ class OrderModel(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, index=True, default=uuid.uuid4)
     status = Column(SqlEnum(OrderStatus), nullable=False, default=OrderStatus.NEW)
     user_id = Column(UUID(as_uuid=True), ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
-    timestamp = Column(DateTime(timezone=True), nullable=False, default=datetime.now(timezone.utc))
+    timestamp = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
     direction = Column(SqlEnum(Direction), nullable=False)
     ticker = Column(String, ForeignKey("instrument.ticker", ondelete="CASCADE"), nullable=False)
     qty = Column(Integer, nullable=False)
     price = Column(Integer, nullable=True)
     filled = Column(Integer, nullable=False, default=0)
+    time_in_force = Column(SqlEnum(TimeInForce), nullable=False, default=TimeInForce.GTC)
+    # entry_seq is time priority within a price; seq is the order's latest event
+    entry_seq = Column(BigInteger, nullable=False)
+    seq = Column(BigInteger, nullable=False)
+
+    type = Column(SqlEnum(OrderType), nullable=False)
+
+
+class OrderHistoryModel(Base):
+    __tablename__ = "orders_history"
+    __table_args__ = {"postgresql_partition_by": "RANGE (timestamp)"}
+
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    status = Column(SqlEnum(OrderStatus), nullable=False)
+    user_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    timestamp = Column(DateTime(timezone=True), primary_key=True)
+    direction = Column(SqlEnum(Direction), nullable=False)
+    ticker = Column(String, nullable=False)
+    qty = Column(Integer, nullable=False)
+    price = Column(Integer, nullable=True)
+    filled = Column(Integer, nullable=False, default=0)
+    time_in_force = Column(SqlEnum(TimeInForce), nullable=False, default=TimeInForce.GTC)
+    entry_seq = Column(BigInteger, nullable=False)
+    seq = Column(BigInteger, nullable=False)
 
     type = Column(SqlEnum(OrderType), nullable=False)
@@ -0,0 +1,22 @@
+# src/models/reservation.py
+from sqlalchemy import Column, BigInteger, Integer, String, ForeignKey, DateTime
+from sqlalchemy.dialects.postgresql import UUID
+
+from src.database.database import Base
+
+
+class ReservationModel(Base):
+    """Reservation open orders require, kept from order events rather than from balance."""
+    __tablename__ = "reservation_ledger"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    ticker = Column(String, ForeignKey("instrument.ticker", ondelete="CASCADE"), primary_key=True)
+    expected = Column(BigInteger, nullable=False, default=0)
+
+
+class ReservationLedgerStateModel(Base):
+    """Single row written by rebuild_reservations; until it exists the ledger may miss older orders."""
+    __tablename__ = "reservation_ledger_state"
+
+    id = Column(Integer, primary_key=True)
+    rebuilt_at = Column(DateTime(timezone=True), nullable=False)
@@ -1,5 +1,5 @@
 # src/models/transaction.py
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Index
 from datetime import datetime, timezone
 
 from src.database.database import Base
@@ -7,9 +7,15 @@ from src.database.database import Base
 
 class TransactionModel(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        Index("ix_transactions_ticker_timestamp", "ticker", "timestamp"),
+        Index("ix_transactions_ticker_seq", "ticker", "seq"),
+        {"postgresql_partition_by": "RANGE (timestamp)"}
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     ticker = Column(String, ForeignKey("instrument.ticker", ondelete="CASCADE"), nullable=False)
     price = Column(Integer, nullable=False)
     qty = Column(Integer, nullable=False)
-    timestamp = Column(DateTime(timezone=True), nullable=False, default=datetime.now(timezone.utc))
+    seq = Column(BigInteger, nullable=False)
+    timestamp = Column(DateTime(timezone=True), primary_key=True, default=lambda: datetime.now(timezone.utc))
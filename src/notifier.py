@@ -0,0 +1,143 @@
+# src/notifier.py
+import asyncio
+import os
+from typing import Dict, List, Set
+from uuid import UUID
+
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src.metrics import Counter, Gauge
+from src.models.fill import FillModel
+from src.serialization import fill_row
+
+
+ORDER_WAIT_TIMEOUT = float(os.getenv("ORDER_WAIT_TIMEOUT", "30"))
+ORDER_WAIT_MAX_TIMEOUT = float(os.getenv("ORDER_WAIT_MAX_TIMEOUT", "60"))
+# Unsent reports a stream may queue before it is closed
+EXECUTIONS_QUEUE_SIZE = int(os.getenv("EXECUTIONS_QUEUE_SIZE", "1000"))
+EXECUTIONS_BACKFILL_BATCH = int(os.getenv("EXECUTIONS_BACKFILL_BATCH", "1000"))
+# Heartbeat interval for a quiet stream; sharded workers also poll other workers' fills then
+EXECUTIONS_HEARTBEAT = float(os.getenv("EXECUTIONS_HEARTBEAT", "15"))
+
+PENDING_KEY = "changed_orders"
+FILLS_KEY = "recorded_fills"
+
+waiters_gauge = Gauge(
+    "order_wait_waiters",
+    "Long-poll requests parked until an order changes"
+)
+streams_gauge = Gauge(
+    "execution_streams",
+    "Open execution report streams"
+)
+stream_overflows_total = Counter(
+    "execution_stream_overflows_total",
+    "Execution report streams closed because the client was reading too slowly"
+)
+
+
+class OrderNotifier:
+    """Wakes this process's long-poll requests waiting for an order to change."""
+
+    def __init__(self):
+        self._waiters: Dict[UUID, Set[asyncio.Future]] = {}
+
+    def subscribe(self, order_id: UUID) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(order_id, set()).add(future)
+        waiters_gauge.inc()
+        return future
+
+    def unsubscribe(self, order_id: UUID, future: asyncio.Future):
+        waiters = self._waiters.get(order_id)
+        if waiters is None or future not in waiters:
+            return
+        waiters.discard(future)
+        waiters_gauge.dec()
+        if not waiters:
+            del self._waiters[order_id]
+
+    def notify(self, order_id: UUID):
+        for future in self._waiters.get(order_id, ()):
+            if not future.done():
+                future.set_result(None)
+
+
+order_notifier = OrderNotifier()
+
+
+class Subscription:
+    __slots__ = ("queue", "overflowed")
+
+    def __init__(self, size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(size)
+        self.overflowed = False
+
+
+class ExecutionFeed:
+    """Hands execution reports to the users' open streams in this process."""
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers: Dict[UUID, Set[Subscription]] = {}
+
+    def subscribe(self, user_id: UUID) -> Subscription:
+        subscription = Subscription(self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        streams_gauge.inc()
+        return subscription
+
+    def unsubscribe(self, user_id: UUID, subscription: Subscription):
+        subscriptions = self._subscribers.get(user_id)
+        if subscriptions is None or subscription not in subscriptions:
+            return
+        subscriptions.discard(subscription)
+        streams_gauge.dec()
+        if not subscriptions:
+            del self._subscribers[user_id]
+
+    def publish(self, fill: FillModel):
+        for subscription in self._subscribers.get(fill.user_id, ()):
+            if subscription.overflowed:
+                continue
+            try:
+                subscription.queue.put_nowait(fill_row(fill))
+            except asyncio.QueueFull:
+                # The client reconnects with after and reads what it missed from the DB
+                subscription.overflowed = True
+                stream_overflows_total.inc()
+
+
+execution_feed = ExecutionFeed(EXECUTIONS_QUEUE_SIZE)
+
+
+def order_changed(order_id: UUID, db: AsyncSession):
+    """Waiters hear about the order only after the transaction commits."""
+    db.info.setdefault(PENDING_KEY, set()).add(order_id)
+
+
+def fills_recorded(fills: List[FillModel], db: AsyncSession):
+    db.info.setdefault(FILLS_KEY, []).extend(fills)
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_committed(session: Session):
+    # Releasing a SAVEPOINT (group commit) fires too; wait for the outer commit
+    if session.in_nested_transaction():
+        return
+    for order_id in session.info.pop(PENDING_KEY, ()):
+        order_notifier.notify(order_id)
+    for fill in session.info.pop(FILLS_KEY, ()):
+        # The session already dropped fills from a rolled-back SAVEPOINT
+        if inspect(fill).persistent:
+            execution_feed.publish(fill)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back(session: Session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop(PENDING_KEY, None)
+    session.info.pop(FILLS_KEY, None)
@@ -0,0 +1,250 @@
+# src/reconcile.py
+"""Reconcile balance.reserved with the reservations open orders require.
+
+python -m src.reconcile            - report drift
+python -m src.reconcile --repair   - report drift and set reserved from the ledger
+python -m src.reconcile --rebuild  - recompute the ledger from orders (once after a schema upgrade)
+
+reservation_ledger changes in the same transaction as the orders, so the check compares two small
+tables by primary key in batches of users and never reads orders.
+"""
+import argparse
+import asyncio
+import os
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import and_, bindparam, case, delete, func, literal, String, text, true, union_all
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from src.logger import logger
+from src.metrics import Counter, Gauge
+from src.models.balance import BalanceModel, BalanceStripeModel
+from src.models.order import OrderModel
+from src.models.reservation import ReservationModel, ReservationLedgerStateModel
+from src.models.user import UserModel
+from src.schemas.schemas import Direction, OrderStatus
+from src.striping import lock_account
+
+
+RECONCILE_INTERVAL = float(os.getenv("RECONCILE_INTERVAL", "60"))
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "10000"))
+# 1 sets reserved from the ledger, 0 only reports drift
+RECONCILE_REPAIR = os.getenv("RECONCILE_REPAIR", "0") == "1"
+
+DELTAS_KEY = "reservation_deltas"
+
+drift_gauge = Gauge(
+    "reservation_drift_accounts",
+    "Accounts whose reserved differed from open-order exposure at the last reconciliation"
+)
+repairs_total = Counter(
+    "reservation_repairs_total",
+    "Balance reservations corrected by reconciliation"
+)
+
+
+def order_exposure(order: OrderModel) -> Tuple[str, int]:
+    """Asset and amount a limit order holds in reserve for its remaining qty."""
+    remaining = order.qty - order.filled
+    if order.direction == Direction.BUY:
+        return "RUB", remaining * order.price
+    return order.ticker, remaining
+
+
+def expect_reservation(user_id: UUID, ticker: str, delta: int, db: AsyncSession):
+    """Records a change of the expected reserve; flush_reservations writes it to the ledger."""
+    if delta:
+        deltas = db.info.setdefault(DELTAS_KEY, {})
+        deltas[(user_id, ticker)] = deltas.get((user_id, ticker), 0) + delta
+
+
+def discard_reservations(db: AsyncSession):
+    # Changes from an order rolled back to its group-commit SAVEPOINT must not leak into the next one
+    db.info.pop(DELTAS_KEY, None)
+
+
+async def flush_reservations(db: AsyncSession):
+    deltas: Dict[Tuple[UUID, str], int] = db.info.pop(DELTAS_KEY, {})
+    changes = sorted(((key, delta) for key, delta in deltas.items() if delta), key=lambda x: (str(x[0][0]), x[0][1]))
+    if not changes:
+        return
+    rows = func.unnest(
+        bindparam("user_ids", [key[0] for key, _ in changes], type_=ARRAY(PG_UUID(as_uuid=True))),
+        bindparam("tickers", [key[1] for key, _ in changes], type_=ARRAY(String)),
+        bindparam("deltas", [delta for _, delta in changes], type_=ARRAY(ReservationModel.expected.type))
+    ).table_valued("user_id", "ticker", "delta").render_derived()
+    stmt = insert(ReservationModel).from_select(
+        ["user_id", "ticker", "expected"],
+        select(rows.c.user_id, rows.c.ticker, rows.c.delta)
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ReservationModel.user_id, ReservationModel.ticker],
+        set_={"expected": ReservationModel.expected + stmt.excluded.expected}
+    )
+    await db.execute(stmt)
+
+
+async def rebuild_reservations(db: AsyncSession) -> int:
+    """Recomputes the ledger from open orders; writes to orders are blocked meanwhile."""
+    await db.execute(text("LOCK TABLE orders IN SHARE MODE"))
+    await db.execute(delete(ReservationModel))
+    is_buy = OrderModel.direction == Direction.BUY
+    remaining = OrderModel.qty - OrderModel.filled
+    asset = case((is_buy, literal("RUB")), else_=OrderModel.ticker)
+    result = await db.execute(
+        insert(ReservationModel).from_select(
+            ["user_id", "ticker", "expected"],
+            select(
+                OrderModel.user_id,
+                asset,
+                func.sum(case((is_buy, remaining * OrderModel.price), else_=remaining))
+            )
+            .where(
+                and_(
+                    OrderModel.status.in_([OrderStatus.NEW, OrderStatus.PARTIALLY_EXECUTED]),
+                    OrderModel.price.isnot(None)
+                )
+            )
+            .group_by(OrderModel.user_id, asset)
+        )
+    )
+    stmt = insert(ReservationLedgerStateModel).values(id=1, rebuilt_at=func.now())
+    await db.execute(stmt.on_conflict_do_update(index_elements=[ReservationLedgerStateModel.id],
+                                                set_={"rebuilt_at": stmt.excluded.rebuilt_at}))
+    return result.rowcount
+
+
+async def ledger_rebuilt(db: AsyncSession) -> bool:
+    result = await db.execute(select(ReservationLedgerStateModel.id))
+    return result.first() is not None
+
+
+async def find_drift(after: Optional[UUID], limit: int, db: AsyncSession):
+    """Drift for the next batch of users by id; also returns the cursor, or None at the end."""
+    result = await db.execute(
+        select(UserModel.id)
+        .where(UserModel.id > after if after is not None else true())
+        .order_by(UserModel.id)
+        .limit(limit)
+    )
+    ids = result.scalars().all()
+    if not ids:
+        return [], None
+    first, last = ids[0], ids[-1]
+
+    held = union_all(
+        select(BalanceModel.user_id, BalanceModel.instrument_ticker, BalanceModel.reserved)
+        .where(BalanceModel.user_id.between(first, last)),
+        select(BalanceStripeModel.user_id, BalanceStripeModel.instrument_ticker, BalanceStripeModel.reserved)
+        .where(BalanceStripeModel.user_id.between(first, last))
+    ).subquery()
+    reserved = (
+        select(held.c.user_id, held.c.instrument_ticker.label("ticker"), func.sum(held.c.reserved).label("reserved"))
+        .group_by(held.c.user_id, held.c.instrument_ticker)
+        .subquery()
+    )
+    ledger = (
+        select(ReservationModel.user_id, ReservationModel.ticker, ReservationModel.expected)
+        .where(ReservationModel.user_id.between(first, last))
+        .subquery()
+    )
+    actual = func.coalesce(reserved.c.reserved, 0)
+    expected = func.coalesce(ledger.c.expected, 0)
+    result = await db.execute(
+        select(
+            func.coalesce(reserved.c.user_id, ledger.c.user_id).label("user_id"),
+            func.coalesce(reserved.c.ticker, ledger.c.ticker).label("ticker"),
+            actual.label("reserved"),
+            expected.label("expected")
+        )
+        .select_from(
+            reserved.join(
+                ledger,
+                and_(reserved.c.user_id == ledger.c.user_id, reserved.c.ticker == ledger.c.ticker),
+                full=True
+            )
+        )
+        .where(actual != expected)
+    )
+    return result.all(), last
+
+
+async def repair_reservation(user_id: UUID, ticker: str, db: AsyncSession) -> bool:
+    # Only transactions already holding the account's balance row change its ledger entry,
+    # so under lock_account the ledger and reserved are read consistently
+    main, stripes = await lock_account(user_id, ticker, db)
+    result = await db.execute(select(ReservationModel.expected).filter_by(user_id=user_id, ticker=ticker))
+    expected = result.scalar_one_or_none() or 0
+    rows = ([main] if main is not None else []) + stripes
+    diff = expected - sum(r.reserved for r in rows)
+    if diff == 0:
+        return False
+    if not rows:
+        logger.warning(f"Reservation drift for {user_id}/{ticker}: no balance record to repair")
+        return False
+
+    if diff > 0:
+        rows[0].reserved += diff
+    else:
+        for r in rows:
+            take = min(r.reserved, -diff)
+            r.reserved -= take
+            diff += take
+    repairs_total.inc()
+    return True
+
+
+async def reconcile_reservations(db: AsyncSession, repair: bool = RECONCILE_REPAIR) -> List[dict]:
+    if repair and not await ledger_rebuilt(db):
+        # A ledger created empty next to existing open orders would zero out reservations they still hold
+        logger.warning("Reservation ledger was never rebuilt, reporting drift without repair; "
+                       "run 'python -m src.reconcile --rebuild' first")
+        repair = False
+    drift = []
+    after = None
+    while True:
+        rows, after = await find_drift(after, RECONCILE_BATCH_SIZE, db)
+        # Don't keep a snapshot open between batches
+        await db.commit()
+        if after is None:
+            break
+        for row in rows:
+            repaired = repair and await repair_reservation(row.user_id, row.ticker, db)
+            await db.commit()
+            drift.append({**row._asdict(), "repaired": repaired})
+
+    drift_gauge.set(value=len(drift))
+    for row in drift[:10]:
+        logger.warning(
+            f"Reservation drift for {row['user_id']}/{row['ticker']}: "
+            f"reserved={row['reserved']} expected={row['expected']}{' (repaired)' if row['repaired'] else ''}"
+        )
+    return drift
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile balance reservations against open orders")
+    parser.add_argument("--rebuild", action="store_true", help="recompute the ledger from the orders table first")
+    parser.add_argument("--repair", action="store_true", help="set reserved to the ledger value where they differ")
+    args = parser.parse_args()
+
+    from src.database.database import AsyncSessionLocal
+    # Outside the app nothing imports the other models, and foreign keys can't resolve without them
+    import src.utils  # noqa: F401
+
+    async def run():
+        async with AsyncSessionLocal() as db:
+            if args.rebuild:
+                logger.info(f"Rebuilt reservation ledger: {await rebuild_reservations(db)} accounts")
+                await db.commit()
+            drift = await reconcile_reservations(db, repair=args.repair)
+            logger.info(f"Reservation drift: {len(drift)} accounts")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# src/replay.py
+"""Replay a stream of orders and cancels without HTTP or a database.
+
+python -m src.replay --log events.ndjson --out result.ndjson
+python -m src.replay --from-db --export events.ndjson --out result.ndjson
+
+The log is NDJSON, one event per line, in arrival order:
+{"type": "order", "id": "...", "user_id": "...", "ticker": "MEM", "direction": "BUY", "qty": 10, "price": 50, "time_in_force": "GTC"}
+{"type": "cancel", "id": "..."}
+Market orders have price null. The output is the trades and final books, also NDJSON, followed by
+a digest of the output: equal digests from two engine versions on one log check determinism.
+
+With --from-db the log is rebuilt from orders/orders_history by entry_seq and seq, and trades are
+checked against transactions. Balances are not modelled: makers the DB engine skipped for lack of
+funds, and trades from before an order reset, show up as mismatches.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import time
+from itertools import takewhile
+from typing import Dict, Iterable, Iterator, List, Optional
+from uuid import UUID
+
+import orjson
+
+# The models are only needed as a schema description; without --from-db no connection is opened
+os.environ.setdefault("DATABASE_URL", "postgresql+asyncpg://localhost/unused")
+
+from src.book import OrderBook  # noqa: E402
+from src.matching import crosses, has_liquidity, resolve_order  # noqa: E402
+from src.schemas.schemas import Direction, OrderStatus, TimeInForce  # noqa: E402
+
+
+class ReplayEngine:
+    """The src.matching rules, as in place_order/cancel_user_order, over in-memory books.
+
+    Event numbers are issued like next_sequence in the DB: entry, each trade, cancelling the rest.
+    """
+
+    def __init__(self):
+        self.books: Dict[str, OrderBook] = {}
+        self.seqs: Dict[str, int] = {}
+        self.rejected = 0
+
+    def _book(self, ticker: str) -> OrderBook:
+        book = self.books.get(ticker)
+        if book is None:
+            book = self.books[ticker] = OrderBook(ticker)
+            self.seqs[ticker] = 0
+        return book
+
+    def _next_seq(self, ticker: str) -> int:
+        self.seqs[ticker] += 1
+        return self.seqs[ticker]
+
+    @staticmethod
+    def _has_liquidity(book: OrderBook, is_bid: bool, price: Optional[int], qty: int) -> bool:
+        resting = book.resting(not is_bid)
+        if price is None:
+            # As in execute_market_order: a market order is checked against the makers' full qty
+            return has_liquidity((book.qty[handle] for handle in resting), qty)
+        # As get_available_liquidity for FOK: remaining qty of makers whose price crosses
+        crossing = takewhile(lambda handle: crosses(is_bid, price, book.price[handle]), resting)
+        return has_liquidity((book.remaining(handle) for handle in crossing), qty)
+
+    def order(self, order_id: UUID, user_id: UUID, ticker: str, is_bid: bool, qty: int,
+              price: Optional[int], time_in_force: TimeInForce = TimeInForce.GTC) -> List[dict]:
+        book = self._book(ticker)
+        if (price is None or time_in_force == TimeInForce.FOK) and not self._has_liquidity(book, is_bid, price, qty):
+            # The DB rolls such an order back together with its number
+            self.rejected += 1
+            return []
+
+        entry_seq = self._next_seq(ticker)
+        fills = book.match(is_bid, price, qty, lambda: self._next_seq(ticker))
+        # Executed orders' state is not persisted here
+        book.release_executed()
+        trades = [
+            {"type": "trade", "ticker": ticker, "price": fill_price, "qty": fill_qty, "seq": seq,
+             "taker_order_id": order_id, "maker_order_id": maker_id}
+            for maker_id, _, fill_qty, fill_price, seq in fills
+        ]
+        filled = sum(fill[2] for fill in fills)
+        # Makers' funds are not modelled, so a FOK order that passed the liquidity check fills completely
+        status = resolve_order(price is None, time_in_force, qty, filled)
+        if status == OrderStatus.CANCELLED:
+            self._next_seq(ticker)
+        elif status in [OrderStatus.NEW, OrderStatus.PARTIALLY_EXECUTED]:
+            last_seq = fills[-1][4] if fills else entry_seq
+            book.add(order_id, user_id, is_bid, price, qty, filled, entry_seq, last_seq)
+        return trades
+
+    def cancel(self, order_id: UUID):
+        for ticker, book in self.books.items():
+            handle = book.handle(order_id)
+            if handle is not None:
+                self._next_seq(ticker)
+                book.remove(handle)
+                return
+        # Unknown or finished order: the DB answers 400/404 and rolls back
+        self.rejected += 1
+
+    def apply(self, event: dict) -> List[dict]:
+        if event["type"] == "cancel":
+            self.cancel(UUID(event["id"]))
+            return []
+        return self.order(
+            UUID(event["id"]), UUID(event["user_id"]), event["ticker"],
+            event["direction"] == Direction.BUY, event["qty"], event.get("price"),
+            TimeInForce(event.get("time_in_force", TimeInForce.GTC))
+        )
+
+    def book_rows(self) -> List[dict]:
+        return [
+            {"type": "book", "ticker": ticker, "seq": self.seqs[ticker],
+             "bid_levels": book.levels(True), "ask_levels": book.levels(False)}
+            for ticker, book in sorted(self.books.items())
+        ]
+
+
+def read_log(path: str) -> Iterator[dict]:
+    with (sys.stdin.buffer if path == "-" else open(path, "rb")) as file:
+        for line in file:
+            if line.strip():
+                yield orjson.loads(line)
+
+
+async def load_db_events():
+    """Order events in per-ticker number order from the order tables, plus trades from transactions."""
+    from sqlalchemy import select, union_all
+
+    from src.database.database import AsyncSessionLocal
+    from src.models.order import OrderHistoryModel, OrderModel, OrderType
+    from src.models.transaction import TransactionModel
+
+    def columns(model):
+        return select(
+            model.id, model.user_id, model.ticker, model.direction, model.qty, model.price,
+            model.time_in_force, model.type, model.status, model.entry_seq, model.seq
+        )
+
+    async with AsyncSessionLocal() as db:
+        orders = await db.execute(union_all(columns(OrderModel), columns(OrderHistoryModel)))
+        keyed = []
+        for row in orders:
+            keyed.append(((row.ticker, row.entry_seq), {
+                "type": "order", "id": str(row.id), "user_id": str(row.user_id), "ticker": row.ticker,
+                "direction": row.direction.value, "qty": row.qty,
+                "price": row.price if row.type == OrderType.LIMIT else None,
+                "time_in_force": row.time_in_force.value
+            }))
+            # An API cancel is the only event of a GTC order after entry that has its own number
+            if (row.status == OrderStatus.CANCELLED and row.type == OrderType.LIMIT
+                    and row.time_in_force == TimeInForce.GTC):
+                keyed.append(((row.ticker, row.seq), {"type": "cancel", "id": str(row.id)}))
+        keyed.sort(key=lambda item: item[0])
+
+        transactions = await db.execute(
+            select(TransactionModel.ticker, TransactionModel.seq, TransactionModel.price, TransactionModel.qty)
+        )
+        expected = {(row.ticker, row.seq): (row.price, row.qty) for row in transactions}
+    return [event for _, event in keyed], expected
+
+
+def compare_trades(trades: List[dict], expected: Dict[tuple, tuple]) -> Dict[str, int]:
+    # Old transactions partitions may have been dropped: compare from each ticker's first stored trade
+    first: Dict[str, int] = {}
+    for ticker, seq in expected:
+        first[ticker] = min(seq, first.get(ticker, seq))
+    counts = {"matched": 0, "mismatched": 0, "unexpected": 0, "missing": 0}
+    seen = set()
+    for trade in trades:
+        key = (trade["ticker"], trade["seq"])
+        if key not in expected:
+            if trade["seq"] >= first.get(trade["ticker"], 0):
+                counts["unexpected"] += 1
+            continue
+        seen.add(key)
+        counts["matched" if expected[key] == (trade["price"], trade["qty"]) else "mismatched"] += 1
+    counts["missing"] = len(expected) - len(seen)
+    return counts
+
+
+def write_lines(path: str, rows: Iterable[dict]) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with (sys.stdout.buffer if path == "-" else open(path, "wb")) as file:
+        for row in rows:
+            line = orjson.dumps(row, default=str) + b"\n"
+            digest.update(line)
+            file.write(line)
+    return digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an order/cancel log through the matching rules without a database")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--log", help="NDJSON event log, '-' for stdin")
+    source.add_argument("--from-db", action="store_true", help="rebuild the log from orders/orders_history (DATABASE_URL)")
+    parser.add_argument("--export", help="write the rebuilt log here (with --from-db)")
+    parser.add_argument("--out", default="-", help="NDJSON trades and final books, '-' for stdout")
+    args = parser.parse_args()
+
+    expected = None
+    if args.from_db:
+        events, expected = asyncio.run(load_db_events())
+        if args.export:
+            write_lines(args.export, events)
+    else:
+        events = list(read_log(args.log))
+
+    engine = ReplayEngine()
+    trades: List[dict] = []
+    started = time.perf_counter()
+    for event in events:
+        trades.extend(engine.apply(event))
+    elapsed = time.perf_counter() - started
+
+    digest = write_lines(args.out, [*trades, *engine.book_rows()])
+    report = {
+        "events": len(events),
+        "trades": len(trades),
+        "rejected": engine.rejected,
+        "seconds": round(elapsed, 3),
+        "events_per_second": round(len(events) / elapsed) if elapsed else None,
+        "digest": digest
+    }
+    if expected is not None:
+        report.update(compare_trades(trades, expected))
+    print(orjson.dumps(report).decode(), file=sys.stderr)
+    if expected is not None and (report["mismatched"] or report["unexpected"] or report["missing"]):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
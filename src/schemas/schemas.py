@@ -19,6 +19,12 @@ class Body_withdraw_api_v1_admin_balance_withdraw_post(BaseModel):
     amount: conint(gt=0)
 
 
+class Body_stripe_api_v1_admin_balance_stripe_post(BaseModel):
+    user_id: UUID
+    ticker: str
+    stripes: conint(ge=0, le=64)
+
+
 class Instrument(BaseModel):
     name: str
     ticker: pydantic.constr(pattern="^[A-Z]{2,10}$")
@@ -56,11 +62,23 @@ class OrderStatus(str, Enum):
     CANCELLED = "CANCELLED"
 
 
+class TimeInForce(str, Enum):
+    GTC = "GTC"
+    IOC = "IOC"
+    FOK = "FOK"
+
+
+class Liquidity(str, Enum):
+    MAKER = "MAKER"
+    TAKER = "TAKER"
+
+
 class LimitOrderBody(BaseModel):
     direction: Direction
     ticker: str
     qty: conint(ge=1)
     price: conint(gt=0)
+    time_in_force: TimeInForce = TimeInForce.GTC
 
 
 class MarketOrderBody(BaseModel):
@@ -74,6 +92,7 @@ class LimitOrder(BaseModel):
     status: OrderStatus
     user_id: UUID
     timestamp: datetime
+    seq: int
     body: LimitOrderBody
     filled: int = 0
 
@@ -83,6 +102,7 @@ class MarketOrder(BaseModel):
     status: OrderStatus
     user_id: UUID
     timestamp: datetime
+    seq: int
     body: MarketOrderBody
 
 
@@ -101,8 +121,32 @@ class L2OrderBook(BaseModel):
     ask_levels: list[Level]
 
 
+class DepthLevel(BaseModel):
+    price: int
+    qty: int
+    total: int
+
+
+class DepthOrderBook(BaseModel):
+    bid_levels: list[DepthLevel]
+    ask_levels: list[DepthLevel]
+
+
 class Transaction(BaseModel):
     ticker: str
     amount: int
     price: int
     timestamp: datetime
+    seq: int
+
+
+class Execution(BaseModel):
+    id: int
+    order_id: UUID
+    ticker: str
+    direction: Direction
+    liquidity: Liquidity
+    price: int
+    qty: int
+    seq: int
+    timestamp: datetime
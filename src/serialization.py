@@ -0,0 +1,88 @@
+# src/serialization.py
+from typing import Any, Iterable, List
+from uuid import UUID
+
+import orjson
+from fastapi.responses import Response
+
+from src.models.fill import FillModel
+from src.models.order import OrderModel
+from src.models.transaction import TransactionModel
+
+
+def _default(value: Any):
+    # asyncpg returns its own UUID subclass, and orjson only knows uuid.UUID
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError
+
+
+def dumps(content: Any) -> bytes:
+    # orjson handles UUID, datetime and str enums itself; UTC is written as "Z", as Pydantic does
+    return orjson.dumps(content, default=_default, option=orjson.OPT_UTC_Z)
+
+
+class FastJSONResponse(Response):
+    """Writes ready dicts/lists straight to JSON, skipping response_model validation."""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def order_row(order: OrderModel) -> dict:
+    """Same shape as LimitOrder/MarketOrder from create_order_dict; works for select() rows too."""
+    row = {
+        "id": order.id,
+        "status": order.status,
+        "user_id": order.user_id,
+        "timestamp": order.timestamp,
+        "seq": order.seq
+    }
+    if order.type == "MARKET":
+        row["body"] = {
+            "direction": order.direction,
+            "ticker": order.ticker,
+            "qty": order.qty
+        }
+    else:
+        row["body"] = {
+            "direction": order.direction,
+            "ticker": order.ticker,
+            "qty": order.qty,
+            "price": order.price,
+            "time_in_force": order.time_in_force
+        }
+        row["filled"] = order.filled
+    return row
+
+
+def order_rows(orders: Iterable[OrderModel]) -> List[dict]:
+    return [order_row(order) for order in orders]
+
+
+def transaction_rows(transactions: Iterable[TransactionModel]) -> List[dict]:
+    return [
+        {
+            "ticker": tx.ticker,
+            "amount": tx.qty,
+            "price": tx.price,
+            "timestamp": tx.timestamp,
+            "seq": tx.seq
+        }
+        for tx in transactions
+    ]
+
+
+def fill_row(fill: FillModel) -> dict:
+    return {
+        "id": fill.id,
+        "order_id": fill.order_id,
+        "ticker": fill.ticker,
+        "direction": fill.direction,
+        "liquidity": fill.liquidity,
+        "price": fill.price,
+        "qty": fill.qty,
+        "seq": fill.seq,
+        "timestamp": fill.timestamp
+    }
@@ -0,0 +1,95 @@
+# src/serve.py
+"""Run several workers with ticker sharding.
+
+python -m src.serve --workers 4 --host 0.0.0.0 --port 8000
+
+All workers accept connections on a shared TCP socket; each owns a share of the tickers
+(consistent hashing) and listens on its own unix socket for forwarded orders.
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+
+from src.logger import logger
+
+
+def init_schema():
+    import asyncio
+    from src.main import app
+
+    async def startup():
+        async with app.router.lifespan_context(app):
+            pass
+
+    asyncio.run(startup())
+
+
+def run_worker(index: int, workers: int, sock: socket.socket, socket_dir: str):
+    # Sharding settings are read at import time, so the app is imported only here
+    os.environ["SHARD_WORKERS"] = str(workers)
+    os.environ["SHARD_INDEX"] = str(index)
+    os.environ["SHARD_SOCKET_DIR"] = socket_dir
+
+    import uvicorn
+    from src.sharding import shard_socket_path
+
+    path = shard_socket_path(index)
+    if os.path.exists(path):
+        os.remove(path)
+    uds = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    uds.bind(path)
+    uds.listen(1024)
+
+    server = uvicorn.Server(uvicorn.Config("src.main:app"))
+    server.run(sockets=[sock, uds])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run ticker-sharded workers")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--socket-dir", default=os.getenv("SHARD_SOCKET_DIR", "/tmp/toy_exchange"))
+    args = parser.parse_args()
+
+    os.makedirs(args.socket_dir, exist_ok=True)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    ctx = multiprocessing.get_context("fork")
+    # One process creates the schema; concurrent create_all calls conflict in the catalog
+    process = ctx.Process(target=init_schema)
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise SystemExit("Database initialization failed")
+
+    processes = []
+    for index in range(args.workers):
+        process = ctx.Process(
+            target=run_worker,
+            args=(index, args.workers, sock, args.socket_dir),
+            name=f"shard-{index}"
+        )
+        process.start()
+        processes.append(process)
+    logger.info(f"Started {args.workers} sharded workers on {args.host}:{args.port}")
+
+    def shutdown(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
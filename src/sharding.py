@@ -0,0 +1,190 @@
+# src/sharding.py
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import re
+from collections import defaultdict
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy.future import select
+
+from src.asgi import read_body, replay_body
+from src.database.database import read_session
+from src.database.group_commit import ORDER_PERSISTENCE
+from src.logger import logger
+from src.models.order import OrderModel
+
+
+# 1 disables sharding: this process handles every order
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "1"))
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", "0"))
+SHARD_SOCKET_DIR = os.getenv("SHARD_SOCKET_DIR", "/tmp/toy_exchange")
+SHARD_VNODES = int(os.getenv("SHARD_VNODES", "64"))
+
+FORWARDED_HEADER = b"x-shard-forwarded"
+ORDER_PATH = "/api/v1/order"
+ORDER_ID_PATH = re.compile(r"^/api/v1/order/([^/]+)$")
+ORDER_WAIT_PATH = re.compile(r"^/api/v1/order/([^/]+)/wait$")
+
+
+def sharding_enabled() -> bool:
+    return SHARD_WORKERS > 1
+
+
+def is_leader() -> bool:
+    """Worker that runs whole-database background jobs; always true without sharding."""
+    return SHARD_INDEX == 0
+
+
+def shard_socket_path(index: int) -> str:
+    return os.path.join(SHARD_SOCKET_DIR, f"shard-{index}.sock")
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing of tickers onto workers."""
+
+    def __init__(self, nodes: List[int], vnodes: int):
+        points = sorted((_hash(f"{node}:{v}"), node) for node in nodes for v in range(vnodes))
+        self._keys = [key for key, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def owner(self, ticker: str) -> int:
+        i = bisect.bisect(self._keys, _hash(ticker)) % len(self._keys)
+        return self._nodes[i]
+
+
+ring = HashRing(list(range(SHARD_WORKERS)), SHARD_VNODES)
+
+
+def ticker_owner(ticker: str) -> int:
+    return ring.owner(ticker)
+
+
+def owns_ticker(ticker: str) -> bool:
+    return not sharding_enabled() or ticker_owner(ticker) == SHARD_INDEX
+
+
+_ticker_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+
+def ticker_lock(ticker: str):
+    """Orders on one ticker run one at a time in the owning worker instead of contending for rows."""
+    # Group commit already applies orders one by one
+    if not sharding_enabled() or ORDER_PERSISTENCE == "group":
+        return nullcontext()
+    return _ticker_locks[ticker]
+
+
+async def get_order_ticker(order_id: str) -> Optional[str]:
+    try:
+        order_uuid = UUID(order_id)
+    except ValueError:
+        return None
+    # The ticker never changes, so a lagging replica can only miss new orders, which are then handled locally
+    async with read_session() as db:
+        result = await db.execute(select(OrderModel.ticker).filter_by(id=order_uuid))
+        return result.scalar_one_or_none()
+
+
+def _decode_chunked(body: bytes) -> bytes:
+    out = b""
+    while body:
+        size_line, _, body = body.partition(b"\r\n")
+        size = int(size_line.split(b";")[0], 16)
+        if size == 0:
+            break
+        out += body[:size]
+        body = body[size + 2:]
+    return out
+
+
+async def forward_request(index: int, scope, body: bytes) -> Tuple[int, List[Tuple[bytes, bytes]], bytes]:
+    reader, writer = await asyncio.open_unix_connection(shard_socket_path(index))
+    try:
+        target = scope["path"] + (("?" + scope["query_string"].decode()) if scope["query_string"] else "")
+        lines = [f"{scope['method']} {target} HTTP/1.1".encode(), b"host: shard"]
+        for name, value in scope["headers"]:
+            if name not in (b"host", b"content-length", b"connection", b"transfer-encoding", FORWARDED_HEADER):
+                lines.append(name + b": " + value)
+        lines.append(b"content-length: " + str(len(body)).encode())
+        lines.append(b"connection: close")
+        lines.append(FORWARDED_HEADER + b": " + str(SHARD_INDEX).encode())
+        writer.write(b"\r\n".join(lines) + b"\r\n\r\n" + body)
+        await writer.drain()
+        raw = await reader.read()
+    finally:
+        writer.close()
+
+    head, _, payload = raw.partition(b"\r\n\r\n")
+    status_line, *header_lines = head.split(b"\r\n")
+    status = int(status_line.split(b" ")[1])
+    headers = []
+    chunked = False
+    for line in header_lines:
+        name, _, value = line.partition(b":")
+        name, value = name.strip().lower(), value.strip()
+        if name == b"transfer-encoding" and value == b"chunked":
+            chunked = True
+            continue
+        if name in (b"connection", b"content-length", b"date", b"server"):
+            continue
+        headers.append((name, value))
+    if chunked:
+        payload = _decode_chunked(payload)
+    headers.append((b"content-length", str(len(payload)).encode()))
+    return status, headers, payload
+
+
+class ShardForwardingMiddleware:
+    """Forwards order operations to the worker that owns the ticker."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or any(name == FORWARDED_HEADER for name, _ in scope["headers"]):
+            await self.app(scope, receive, send)
+            return
+
+        method, path = scope["method"], scope["path"]
+        if method == "POST" and path == ORDER_PATH:
+            body = await read_body(receive)
+            try:
+                ticker = json.loads(body).get("ticker")
+            except (ValueError, AttributeError):
+                ticker = None
+            receive = replay_body(body, receive)
+        elif method == "DELETE" and ORDER_ID_PATH.match(path):
+            body = b""
+            ticker = await get_order_ticker(ORDER_ID_PATH.match(path).group(1))
+        elif method == "GET" and ORDER_WAIT_PATH.match(path):
+            # Fills happen on the owner, the only worker that can wake the wait without polling
+            body = b""
+            ticker = await get_order_ticker(ORDER_WAIT_PATH.match(path).group(1))
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        if not isinstance(ticker, str) or owns_ticker(ticker):
+            await self.app(scope, receive, send)
+            return
+
+        owner = ticker_owner(ticker)
+        try:
+            status, headers, payload = await forward_request(owner, scope, body)
+        except (OSError, ValueError, IndexError):
+            # Owner unavailable: handle it here, row locks in the DB keep this correct
+            logger.warning(f"Shard {owner} is unavailable, handling '{ticker}' order locally")
+            await self.app(scope, receive, send)
+            return
+
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": payload})
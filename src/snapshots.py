@@ -0,0 +1,98 @@
+# src/snapshots.py
+import glob
+import json
+import os
+import time
+from types import SimpleNamespace
+from typing import Dict, Optional, Set
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.sharding import sharding_enabled, owns_ticker, SHARD_SOCKET_DIR
+from src.utils import get_all_instruments, get_bids, get_asks, aggregate_levels
+
+
+ORDERBOOK_SNAPSHOT_INTERVAL = float(os.getenv("ORDERBOOK_SNAPSHOT_INTERVAL", "0.05"))
+# Matches the largest limit of GET /api/v1/public/orderbook
+ORDERBOOK_SNAPSHOT_DEPTH = 25
+# Readers fall back to the DB for older files; owners rewrite idle books at half this age
+ORDERBOOK_SNAPSHOT_MAX_AGE = float(os.getenv("ORDERBOOK_SNAPSHOT_MAX_AGE", "1"))
+
+# None: write every owned ticker on the first run
+_dirty: Optional[Set[str]] = None
+_written: Dict[str, float] = {}
+
+
+def snapshot_path(ticker: str) -> str:
+    return os.path.join(SHARD_SOCKET_DIR, f"orderbook-{ticker}.json")
+
+
+def mark_orderbook_dirty(ticker: str):
+    if _dirty is not None:
+        _dirty.add(ticker)
+
+
+async def write_orderbook_snapshots(db: AsyncSession):
+    """The ticker's owner writes the book snapshot that every worker reads."""
+    global _dirty
+    dirty, _dirty = _dirty, set()
+    refresh_before = time.monotonic() - ORDERBOOK_SNAPSHOT_MAX_AGE / 2
+    try:
+        if dirty is None or any(written < refresh_before for written in _written.values()):
+            owned = {i.ticker for i in await get_all_instruments(db) if owns_ticker(i.ticker)}
+            for ticker in set(_written) - owned:
+                del _written[ticker]
+            tickers = [t for t in owned if dirty is None or t in dirty or _written.get(t, 0) < refresh_before]
+        else:
+            tickers = list(dirty)
+
+        for ticker in tickers:
+            bids = await get_bids(ticker, ORDERBOOK_SNAPSHOT_DEPTH, db)
+            asks = await get_asks(ticker, ORDERBOOK_SNAPSHOT_DEPTH, db)
+            path = snapshot_path(ticker)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({
+                    "bids": [[o.price, o.qty - o.filled] for o in bids],
+                    "asks": [[o.price, o.qty - o.filled] for o in asks]
+                }, f)
+            os.replace(tmp_path, path)
+            _written[ticker] = time.monotonic()
+    except BaseException:
+        if dirty is None:
+            _dirty = None
+        else:
+            _dirty.update(dirty)
+        raise
+
+
+def read_orderbook_snapshot(ticker: str, limit: int) -> Optional[dict]:
+    if not sharding_enabled():
+        return None
+    try:
+        with open(snapshot_path(ticker)) as f:
+            if time.time() - os.fstat(f.fileno()).st_mtime > ORDERBOOK_SNAPSHOT_MAX_AGE:
+                return None
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    def orders(rows):
+        return [SimpleNamespace(type="LIMIT", price=price, qty=qty, filled=0) for price, qty in rows[:limit]]
+
+    return {
+        "bid_levels": aggregate_levels(orders(data["bids"]), is_bid=True),
+        "ask_levels": aggregate_levels(orders(data["asks"]), is_bid=False)
+    }
+
+
+def drop_orderbook_snapshot(ticker: str):
+    try:
+        os.remove(snapshot_path(ticker))
+    except FileNotFoundError:
+        pass
+
+
+def drop_orderbook_snapshots():
+    for path in glob.glob(snapshot_path("*")):
+        os.remove(path)
@@ -0,0 +1,234 @@
+# src/striping.py
+import os
+from uuid import UUID
+from typing import List, Optional, Set, Tuple
+
+from sqlalchemy import and_, func, true, union_all, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from src.database.retry import get_sqlstate
+from src.logger import logger
+from src.metrics import Counter
+from src.models.balance import BalanceModel, BalanceStripeModel
+from src.sharding import owns_ticker
+
+
+HOT_ACCOUNT_REBALANCE_INTERVAL = float(os.getenv("HOT_ACCOUNT_REBALANCE_INTERVAL", "1.0"))
+
+# Cache of striped (user_id, ticker) accounts. It only picks the fast path:
+# on a miss, spread_* still finds the stripes under the account lock.
+striped_accounts: Set[Tuple[UUID, str]] = set()
+
+LOCK_NOT_AVAILABLE = "55P03"
+
+release_clamped_total = Counter(
+    "reservation_release_clamped_total",
+    "Reservation releases larger than the reserved amount, clamped to zero"
+)
+rebalance_skipped_total = Counter(
+    "stripe_rebalance_skipped_total",
+    "Striped accounts skipped by the rebalancer because order flow held their rows"
+)
+
+
+def _stripe_condition(user_id: UUID, ticker: str):
+    return and_(
+        BalanceStripeModel.user_id == user_id,
+        BalanceStripeModel.instrument_ticker == ticker
+    )
+
+
+def _pick_stripe(user_id: UUID, ticker: str, condition):
+    return (
+        select(BalanceStripeModel.stripe)
+        .where(and_(_stripe_condition(user_id, ticker), condition))
+        .order_by(func.random())
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+
+
+async def _update_one_stripe(user_id: UUID, ticker: str, condition, values: dict, db: AsyncSession) -> bool:
+    result = await db.execute(
+        update(BalanceStripeModel)
+        .where(
+            and_(
+                _stripe_condition(user_id, ticker),
+                BalanceStripeModel.stripe == _pick_stripe(user_id, ticker, condition)
+            )
+        )
+        .values(**values)
+        .returning(BalanceStripeModel.stripe)
+        .execution_options(synchronize_session=False)
+    )
+    return result.scalar_one_or_none() is not None
+
+
+async def reserve_on_stripe(user_id: UUID, ticker: str, delta: int, db: AsyncSession) -> bool:
+    if delta > 0:
+        condition = BalanceStripeModel.amount - BalanceStripeModel.reserved >= delta
+    else:
+        condition = BalanceStripeModel.reserved >= -delta
+    return await _update_one_stripe(
+        user_id, ticker, condition, {"reserved": BalanceStripeModel.reserved + delta}, db
+    )
+
+
+async def update_stripe_amount(user_id: UUID, ticker: str, delta: int, db: AsyncSession, release: int = 0) -> bool:
+    # release drops the reserve in the same row, so debiting an order's own reserve isn't blocked by it
+    condition = BalanceStripeModel.amount - BalanceStripeModel.reserved >= -delta - release if delta < 0 else true()
+    if release:
+        condition = and_(condition, BalanceStripeModel.reserved >= release)
+    return await _update_one_stripe(
+        user_id, ticker, condition,
+        {"amount": BalanceStripeModel.amount + delta, "reserved": BalanceStripeModel.reserved - release}, db
+    )
+
+
+async def lock_account(user_id: UUID, ticker: str, db: AsyncSession,
+                       nowait: bool = False) -> Tuple[Optional[BalanceModel], List[BalanceStripeModel]]:
+    result = await db.execute(
+        select(BalanceModel)
+        .where(and_(BalanceModel.user_id == user_id, BalanceModel.instrument_ticker == ticker))
+        .with_for_update(nowait=nowait)
+        .execution_options(populate_existing=True)
+    )
+    main = result.scalar_one_or_none()
+    result = await db.execute(
+        select(BalanceStripeModel)
+        .where(_stripe_condition(user_id, ticker))
+        .order_by(BalanceStripeModel.stripe)
+        .with_for_update(nowait=nowait)
+        .execution_options(populate_existing=True)
+    )
+    return main, list(result.scalars().all())
+
+
+async def spread_reserve(user_id: UUID, ticker: str, delta: int, db: AsyncSession) -> bool:
+    main, stripes = await lock_account(user_id, ticker, db)
+    rows = ([main] if main is not None else []) + stripes
+    if not rows:
+        return False
+
+    remaining = abs(delta)
+    if delta > 0:
+        if sum(max(0, r.amount - r.reserved) for r in rows) < remaining:
+            return False
+        for r in rows:
+            take = min(max(0, r.amount - r.reserved), remaining)
+            r.reserved += take
+            remaining -= take
+    else:
+        # Release what is there: anything above reserved is clamped, as before
+        for r in rows:
+            take = min(r.reserved, remaining)
+            r.reserved -= take
+            remaining -= take
+        if remaining:
+            # The reserve already drifted from the orders; reconcile_reservations finds it in the ledger
+            release_clamped_total.inc()
+            logger.warning(f"Reservation release for {user_id}/{ticker} clamped by {remaining}")
+    return True
+
+
+async def spread_debit(user_id: UUID, ticker: str, amount: int, db: AsyncSession, keep_reserved: bool = False) -> bool:
+    main, stripes = await lock_account(user_id, ticker, db)
+    rows = ([main] if main is not None else []) + stripes
+
+    def spendable(r) -> int:
+        return max(0, r.amount - r.reserved) if keep_reserved else r.amount
+
+    if sum(spendable(r) for r in rows) < amount:
+        return False
+
+    for r in rows:
+        take = min(spendable(r), amount)
+        r.amount -= take
+        amount -= take
+    return True
+
+
+async def get_total_amount(user_id: UUID, ticker: str, db: AsyncSession) -> int:
+    # No lock: this is only a pre-check, the conditional UPDATE on debit stops overspending
+    rows = union_all(
+        select(BalanceModel.amount).where(
+            and_(BalanceModel.user_id == user_id, BalanceModel.instrument_ticker == ticker)
+        ),
+        select(BalanceStripeModel.amount).where(_stripe_condition(user_id, ticker))
+    ).subquery()
+    result = await db.execute(select(func.coalesce(func.sum(rows.c.amount), 0)))
+    return result.scalar_one()
+
+
+async def stripe_account(user_id: UUID, ticker: str, stripes: int, db: AsyncSession) -> bool:
+    main, existing = await lock_account(user_id, ticker, db)
+    if main is None:
+        return False
+
+    for s in existing:
+        main.amount += s.amount
+        main.reserved += s.reserved
+        await db.delete(s)
+    await db.flush()
+
+    if stripes == 0:
+        striped_accounts.discard((user_id, ticker))
+        return True
+
+    free = max(0, main.amount - main.reserved)
+    share, rest = divmod(free, stripes)
+    main.amount -= free
+    db.add_all([
+        BalanceStripeModel(
+            user_id=user_id,
+            instrument_ticker=ticker,
+            stripe=i,
+            amount=share + (1 if i < rest else 0),
+            reserved=0
+        )
+        for i in range(stripes)
+    ])
+    striped_accounts.add((user_id, ticker))
+    return True
+
+
+async def rebalance_account(user_id: UUID, ticker: str, db: AsyncSession):
+    main, stripes = await lock_account(user_id, ticker, db, nowait=True)
+    if not stripes:
+        return
+
+    free = sum(s.amount - s.reserved for s in stripes)
+    if main is not None and main.amount > main.reserved:
+        free += main.amount - main.reserved
+        main.amount = main.reserved
+    if free < 0:
+        return
+
+    share, rest = divmod(free, len(stripes))
+    for i, s in enumerate(stripes):
+        s.amount = s.reserved + share + (1 if i < rest else 0)
+
+
+async def rebalance_stripes(db: AsyncSession):
+    result = await db.execute(
+        select(BalanceStripeModel.user_id, BalanceStripeModel.instrument_ticker).distinct()
+    )
+    accounts = {(row.user_id, row.instrument_ticker) for row in result}
+    striped_accounts.intersection_update(accounts)
+    striped_accounts.update(accounts)
+
+    for user_id, ticker in sorted(accounts, key=lambda x: (str(x[0]), x[1])):
+        # One worker per account; busy accounts wait for the next pass instead of queueing order flow
+        if not owns_ticker(ticker):
+            continue
+        try:
+            await rebalance_account(user_id, ticker, db)
+            await db.commit()
+        except DBAPIError as e:
+            await db.rollback()
+            if get_sqlstate(e) != LOCK_NOT_AVAILABLE:
+                raise
+            rebalance_skipped_total.inc()
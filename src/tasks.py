@@ -0,0 +1,34 @@
+# src/tasks.py
+import asyncio
+from typing import Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.database import AsyncSessionLocal
+from src.logger import logger
+
+
+_background_tasks = []
+
+
+async def _run_periodically(name: str, interval: float, fn: Callable[[AsyncSession], Awaitable[None]]):
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await fn(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"Background task '{name}' failed")
+        await asyncio.sleep(interval)
+
+
+def start_periodic_task(name: str, interval: float, fn: Callable[[AsyncSession], Awaitable[None]]):
+    _background_tasks.append(asyncio.create_task(_run_periodically(name, interval, fn), name=name))
+
+
+async def stop_background_tasks():
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
@@ -0,0 +1,197 @@
+# src/tracing.py
+import contextvars
+import json
+import os
+import queue
+import random
+import socket
+import threading
+import time
+from functools import wraps
+from typing import Optional
+
+from src.logger import logger
+from src.metrics import Counter
+
+
+# Share of requests that record spans: 0 disables tracing, 1 traces every request
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+# "file:/path/to/spans.jsonl" or "udp:127.0.0.1:6831"
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "")
+TRACE_EXPORT_QUEUE_SIZE = int(os.getenv("TRACE_EXPORT_QUEUE_SIZE", "10000"))
+
+spans_dropped_total = Counter(
+    "trace_spans_dropped_total",
+    "Spans dropped because the export queue was full"
+)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "duration", "attributes")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str):
+        self.trace_id = trace_id
+        self.span_id = random.getrandbits(64).to_bytes(8, "big").hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.duration = None
+        self.attributes = {}
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes
+        }
+
+
+class SpanExporter:
+    def __init__(self, target: str, maxsize: int):
+        kind, _, address = target.partition(":")
+        if kind == "file":
+            self.file = open(address, "a", encoding="utf-8")
+            run = self._run_file
+        elif kind == "udp":
+            host, _, port = address.rpartition(":")
+            self.address = (host, int(port))
+            if not host or not 0 < self.address[1] < 65536:
+                raise ValueError(f"invalid udp address '{address}'")
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            run = self._run_udp
+        else:
+            raise ValueError(f"unknown target kind '{kind}'")
+        # Bounded: if the exporter falls behind or its thread dies, spans are dropped instead of piling up
+        self.queue = queue.Queue(maxsize)
+        self.thread = threading.Thread(target=run, name="span-exporter", daemon=True)
+        self.thread.start()
+
+    def export(self, span: Span):
+        try:
+            self.queue.put_nowait(span.to_dict())
+        except queue.Full:
+            spans_dropped_total.inc()
+
+    def _run_file(self):
+        with self.file as f:
+            while True:
+                f.write(json.dumps(self.queue.get()) + "\n")
+                while not self.queue.empty():
+                    f.write(json.dumps(self.queue.get()) + "\n")
+                f.flush()
+
+    def _run_udp(self):
+        while True:
+            try:
+                self.sock.sendto(json.dumps(self.queue.get()).encode(), self.address)
+            except OSError:
+                pass
+
+
+def create_exporter(target: str) -> Optional[SpanExporter]:
+    try:
+        return SpanExporter(target, TRACE_EXPORT_QUEUE_SIZE)
+    except (OSError, ValueError) as e:
+        logger.error(f"Invalid TRACE_EXPORT target '{target}', tracing is disabled: {e}")
+        return None
+
+
+_exporter = create_exporter(TRACE_EXPORT) if TRACE_EXPORT and TRACE_SAMPLE_RATE > 0 else None
+
+
+class span:
+    """Child span of the current request; a no-op when nothing is being traced."""
+    __slots__ = ("name", "span", "token")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.span = None
+
+    def __enter__(self):
+        parent = _current_span.get()
+        if parent is not None:
+            self.span = Span(parent.trace_id, parent.span_id, self.name)
+            self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.span is not None:
+            self.span.duration = time.time() - self.span.start
+            if exc_type is not None:
+                self.span.set("error", exc_type.__name__)
+            _current_span.reset(self.token)
+            _exporter.export(self.span)
+        return False
+
+
+def traced(name: str):
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return await func(*args, **kwargs)
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def parse_traceparent(value: str):
+    # W3C Trace Context: 00-<trace_id>-<parent_id>-<flags>
+    parts = value.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = int(parts[3], 16) & 1 == 1
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+class TracingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if _exporter is None or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        trace_id, parent_id, sampled = None, None, None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                parsed = parse_traceparent(value.decode("latin-1"))
+                if parsed is not None:
+                    trace_id, parent_id, sampled = parsed
+                break
+        if sampled is None:
+            sampled = random.random() < TRACE_SAMPLE_RATE
+        if not sampled:
+            return await self.app(scope, receive, send)
+
+        root = Span(trace_id or random.getrandbits(128).to_bytes(16, "big").hex(), parent_id,
+                    f"{scope['method']} {scope['path']}")
+        token = _current_span.set(root)
+
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                root.set("status_code", message["status"])
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"traceparent", f"00-{root.trace_id}-{root.span_id}-01".encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            root.duration = time.time() - root.start
+            _current_span.reset(token)
+            _exporter.export(root)
@@ -2,30 +2,50 @@
 from uuid import uuid4, UUID
 from fastapi import Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import and_, asc, desc
+from sqlalchemy import and_, asc, desc, bindparam, case, func, literal, String, Integer, text, union_all, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID, insert
 from sqlalchemy.future import select
 from datetime import datetime, timezone
-from typing import Union, List, Optional
+from typing import Union, List, Optional, Dict, Tuple
 
-from src.models.balance import BalanceModel
+from src.models.balance import BalanceModel, BalanceStripeModel
+from src.models.fill import FillModel
 from src.models.instrument import InstrumentModel
-from src.models.order import OrderModel
+from src.models.order import OrderModel, OrderHistoryModel
 from src.models.transaction import TransactionModel
 from src.models.user import UserModel
 from src.database.database import get_db
+from src.database.partitions import ensure_monthly_partitions
+from src.matching import drive, has_liquidity, match_steps, order_status, resolve_order
+from src.notifier import order_changed, fills_recorded
+from src.reconcile import order_exposure, expect_reservation, discard_reservations, flush_reservations
 from src.security import api_key_header
+from src.tracing import span, traced
+from src.striping import (
+    striped_accounts,
+    reserve_on_stripe,
+    update_stripe_amount,
+    spread_reserve,
+    spread_debit,
+    get_total_amount,
+    stripe_account
+)
 from src.schemas.schemas import (
     NewUser,
     Level,
     Instrument,
     Body_deposit_api_v1_admin_balance_deposit_post,
     Body_withdraw_api_v1_admin_balance_withdraw_post,
+    Body_stripe_api_v1_admin_balance_stripe_post,
     LimitOrderBody,
     LimitOrder,
     MarketOrderBody,
     MarketOrder,
     OrderStatus,
     Direction,
+    Liquidity,
+    TimeInForce,
     UserRole
 )
 
@@ -49,11 +69,33 @@ async def register_new_user(user: NewUser, db: AsyncSession = Depends(get_db)):
         api_key=token
     )
     db.add(db_user)
-    await db.commit()
-    await db.refresh(db_user)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Username already exists")
     return db_user
 
 
+async def bulk_register_users(users: List[NewUser], db: AsyncSession):
+    rows = func.unnest(
+        bindparam("ids", [uuid4() for _ in users], type_=ARRAY(PG_UUID(as_uuid=True))),
+        bindparam("names", [user.name for user in users], type_=ARRAY(String)),
+        bindparam("api_keys", [uuid4() for _ in users], type_=ARRAY(PG_UUID(as_uuid=True)))
+    ).table_valued("id", "name", "api_key").render_derived()
+    stmt = (
+        insert(UserModel)
+        .from_select(
+            ["id", "name", "api_key", "role"],
+            select(rows.c.id, rows.c.name, rows.c.api_key, literal(UserRole.USER, UserModel.role.type))
+        )
+        .on_conflict_do_nothing(index_elements=[UserModel.name])
+        .returning(UserModel.id, UserModel.name, UserModel.role, UserModel.api_key)
+    )
+    result = await db.execute(stmt)
+    return [row._asdict() for row in result]
+
+
 async def check_username(username: str, db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(UserModel).filter_by(name=username))
     return result.scalar_one_or_none()
@@ -64,6 +106,7 @@ async def get_user_by_id(user_id: UUID, db: AsyncSession = Depends(get_db)):
     return result.scalar_one_or_none()
 
 
+@traced("auth")
 async def get_user_by_api_key(api_key: UUID, db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(UserModel).filter_by(api_key=api_key))
     return result.scalar_one_or_none()
@@ -89,6 +132,22 @@ async def delete_user_by_id(user_id: UUID, db: AsyncSession = Depends(get_db)):
     return db_user
 
 
+async def reset_orders(db: AsyncSession):
+    await db.execute(text("TRUNCATE TABLE orders, orders_history, fills, reservation_ledger"))
+    await db.execute(
+        update(BalanceModel)
+        .where(BalanceModel.reserved != 0)
+        .values(reserved=0)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(
+        update(BalanceStripeModel)
+        .where(BalanceStripeModel.reserved != 0)
+        .values(reserved=0)
+        .execution_options(synchronize_session=False)
+    )
+
+
 # instruments
 async def get_all_instruments(db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(InstrumentModel))
@@ -137,9 +196,14 @@ async def delete_instrument_by_ticker(ticker: str, db: AsyncSession = Depends(ge
 
 # balances
 async def get_balances_by_user_id(user_id: UUID, db: AsyncSession):
-    result = await db.execute(select(BalanceModel).filter_by(user_id=user_id))
-    db_balances = list(result.scalars().all())
-    balances = {b.instrument_ticker: b.amount for b in db_balances}
+    rows = union_all(
+        select(BalanceModel.instrument_ticker, BalanceModel.amount).filter_by(user_id=user_id),
+        select(BalanceStripeModel.instrument_ticker, BalanceStripeModel.amount).filter_by(user_id=user_id)
+    ).subquery()
+    result = await db.execute(
+        select(rows.c.instrument_ticker, func.sum(rows.c.amount)).group_by(rows.c.instrument_ticker)
+    )
+    balances = {ticker: amount for ticker, amount in result}
     return balances
 
 
@@ -157,6 +221,13 @@ async def check_balance_record(user_id: UUID, ticker: str, db: AsyncSession):
     return result.scalar_one_or_none()
 
 
+async def check_balance_amount(user_id: UUID, ticker: str, amount: int, db: AsyncSession) -> bool:
+    if (user_id, ticker) in striped_accounts:
+        return await get_total_amount(user_id, ticker, db) >= amount
+    record = await check_balance_record(user_id, ticker, db)
+    return record is not None and record.amount >= amount
+
+
 async def user_balance_deposit(request: Body_deposit_api_v1_admin_balance_deposit_post, db: AsyncSession):
     if await get_user_by_id(request.user_id, db) is None:
         raise HTTPException(status_code=404, detail="User Not Found")
@@ -173,8 +244,6 @@ async def user_balance_deposit(request: Body_deposit_api_v1_admin_balance_deposi
             amount=request.amount
         )
     db.add(record)
-    await db.commit()
-    await db.refresh(record)
 
 
 async def user_balance_withdraw(request: Body_withdraw_api_v1_admin_balance_withdraw_post, db: AsyncSession):
@@ -187,51 +256,128 @@ async def user_balance_withdraw(request: Body_withdraw_api_v1_admin_balance_with
     if record is None:
         raise HTTPException(status_code=400, detail="Bad Request")
     else:
+        # Funds reserved for open orders can't be withdrawn, as in bulk_balance_withdraw
         new_amount = record.amount - request.amount
-        if new_amount >= 0:
+        if new_amount >= record.reserved:
             record.amount = new_amount
             db.add(record)
-            await db.commit()
-            await db.refresh(record)
-        else:
+        elif not await spread_debit(request.user_id, request.ticker, request.amount, db, keep_reserved=True):
             raise HTTPException(status_code=403, detail="Insufficient Funds")
         
 
-async def get_available_balance(user_id: UUID, ticker: str, db: AsyncSession) -> int:
-    rec = await check_balance_record(user_id, ticker, db)
-    return 0 if rec is None else rec.amount - rec.reserved
+async def user_balance_stripe(request: Body_stripe_api_v1_admin_balance_stripe_post, db: AsyncSession):
+    if not await stripe_account(request.user_id, request.ticker, request.stripes, db):
+        raise HTTPException(status_code=404, detail="Balance Not Found")
 
 
-async def reserve_balance(user_id: UUID, ticker: str, delta: int, db: AsyncSession):
-    stmt = (
-        select(BalanceModel)
+async def get_bulk_balance_changes(
+        requests: List[Union[Body_deposit_api_v1_admin_balance_deposit_post, Body_withdraw_api_v1_admin_balance_withdraw_post]],
+        db: AsyncSession
+):
+    user_ids = {r.user_id for r in requests}
+    tickers = {r.ticker for r in requests}
+
+    result = await db.execute(select(UserModel.id).where(UserModel.id.in_(user_ids)))
+    missing_users = user_ids - set(result.scalars().all())
+    if missing_users:
+        raise HTTPException(status_code=404, detail=f"User Not Found: {', '.join(sorted(map(str, missing_users)))}")
+
+    result = await db.execute(select(InstrumentModel.ticker).where(InstrumentModel.ticker.in_(tickers)))
+    missing_tickers = tickers - set(result.scalars().all())
+    if missing_tickers:
+        raise HTTPException(status_code=404, detail=f"Ticker Not Found: {', '.join(sorted(missing_tickers))}")
+
+    changes: Dict[Tuple[UUID, str], int] = {}
+    for r in requests:
+        changes[(r.user_id, r.ticker)] = changes.get((r.user_id, r.ticker), 0) + r.amount
+    return func.unnest(
+        bindparam("user_ids", [key[0] for key in changes], type_=ARRAY(PG_UUID(as_uuid=True))),
+        bindparam("tickers", [key[1] for key in changes], type_=ARRAY(String)),
+        bindparam("amounts", list(changes.values()), type_=ARRAY(Integer))
+    ).table_valued("user_id", "ticker", "amount").render_derived(), len(changes)
+
+
+async def bulk_balance_deposit(requests: List[Body_deposit_api_v1_admin_balance_deposit_post], db: AsyncSession):
+    rows, _ = await get_bulk_balance_changes(requests, db)
+    stmt = insert(BalanceModel).from_select(
+        ["user_id", "instrument_ticker", "amount", "reserved"],
+        select(rows.c.user_id, rows.c.ticker, rows.c.amount, literal(0))
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[BalanceModel.user_id, BalanceModel.instrument_ticker],
+        set_={"amount": BalanceModel.amount + stmt.excluded.amount}
+    )
+    await db.execute(stmt)
+
+
+async def bulk_balance_withdraw(requests: List[Body_withdraw_api_v1_admin_balance_withdraw_post], db: AsyncSession):
+    rows, expected = await get_bulk_balance_changes(requests, db)
+    result = await db.execute(
+        update(BalanceModel)
         .where(
             and_(
-                BalanceModel.user_id == user_id,
-                BalanceModel.instrument_ticker == ticker
+                BalanceModel.user_id == rows.c.user_id,
+                BalanceModel.instrument_ticker == rows.c.ticker,
+                BalanceModel.amount - BalanceModel.reserved >= rows.c.amount
             )
         )
-        .with_for_update()
+        .values(amount=BalanceModel.amount - rows.c.amount)
+        .execution_options(synchronize_session=False)
     )
-    result = await db.execute(stmt)
-    rec = result.scalars().first()
+    if result.rowcount != expected:
+        raise HTTPException(status_code=403, detail="Insufficient Funds")
 
-    if rec is None:
-        raise HTTPException(status_code=400, detail="No Balance Record")
 
-    if delta > 0 and rec.reserved + delta > rec.amount:
-        raise HTTPException(status_code=400, detail="Insufficient free balance")
-    if delta < 0 and rec.reserved + delta < 0:
-        delta = -rec.reserved
+async def get_available_balance(user_id: UUID, ticker: str, db: AsyncSession) -> int:
+    rec = await check_balance_record(user_id, ticker, db)
+    return 0 if rec is None else rec.amount - rec.reserved
+
+
+@traced("reserve_balance")
+async def reserve_balance(user_id: UUID, ticker: str, delta: int, db: AsyncSession):
+    if (user_id, ticker) in striped_accounts and await reserve_on_stripe(user_id, ticker, delta, db):
+        return
 
-    rec.reserved += delta
-    db.add(rec)
+    condition = and_(
+        BalanceModel.user_id == user_id,
+        BalanceModel.instrument_ticker == ticker
+    )
+    if delta > 0:
+        condition = and_(condition, BalanceModel.amount - BalanceModel.reserved >= delta)
+    else:
+        condition = and_(condition, BalanceModel.reserved >= -delta)
+    result = await db.execute(
+        update(BalanceModel)
+        .where(condition)
+        .values(reserved=BalanceModel.reserved + delta)
+        .returning(BalanceModel.reserved)
+        .execution_options(synchronize_session="fetch")
+    )
+    if result.scalar_one_or_none() is not None:
+        return
 
+    # The main row can't cover delta: take the rest from the account's stripes under lock
+    if not await spread_reserve(user_id, ticker, delta, db):
+        if delta > 0:
+            raise HTTPException(status_code=400, detail=f"Insufficient '{ticker}' balance for order")
+        raise HTTPException(status_code=400, detail="No Balance Record")
 
-async def lock_and_update_balance(changes: list[tuple[UUID, str, int]], db: AsyncSession):
+
+@traced("lock_and_update_balance")
+async def lock_and_update_balance(
+    changes: list[tuple[UUID, str, int]],
+    db: AsyncSession,
+    releases: Optional[dict[tuple[UUID, str], int]] = None
+):
+    # releases: reserve dropped together with a change to the same account
+    releases = dict(releases or {})
     ordered = sorted(changes, key=lambda x: (str(x[0]), x[1]))
     updated = {}
     for user_id, ticker, delta in ordered:
+        release = releases.pop((user_id, ticker), 0)
+        if (user_id, ticker) in striped_accounts and await update_stripe_amount(user_id, ticker, delta, db, release):
+            continue
+
         stmt = (
             select(BalanceModel)
             .where(
@@ -251,10 +397,13 @@ async def lock_and_update_balance(changes: list[tuple[UUID, str, int]], db: Asyn
             await db.flush()
 
         new_amount = balance.amount + delta
-        if new_amount < 0:
+        if new_amount >= 0:
+            balance.amount = new_amount
+        elif not await spread_debit(user_id, ticker, -delta, db):
             raise HTTPException(status_code=400, detail=f"Insufficient balance for {ticker} of user {user_id}")
+        if release:
+            await reserve_balance(user_id, ticker, -release, db)
 
-        balance.amount = new_amount
         updated[(user_id, ticker)] = balance
 
     return updated
@@ -278,6 +427,39 @@ async def get_max_price_for_market_rub_reserve(ticker: str, db: AsyncSession):
     return max_price
 
 
+async def get_available_liquidity(ticker: str, direction: Direction, price: int, db: AsyncSession) -> int:
+    """Resting qty on the other side at price or better."""
+    is_buy = direction == Direction.BUY
+    result = await db.execute(
+        select(func.coalesce(func.sum(OrderModel.qty - OrderModel.filled), 0))
+        .where(
+            and_(
+                OrderModel.status.in_([OrderStatus.NEW, OrderStatus.PARTIALLY_EXECUTED]),
+                OrderModel.direction == (Direction.SELL if is_buy else Direction.BUY),
+                OrderModel.ticker == ticker,
+                OrderModel.price.isnot(None),
+                OrderModel.price <= price if is_buy else OrderModel.price >= price
+            )
+        )
+    )
+    return result.scalar_one()
+
+
+async def next_sequence(ticker: str, db: AsyncSession) -> int:
+    """Next event number for the ticker; the instrument row stays locked until the transaction ends."""
+    result = await db.execute(
+        update(InstrumentModel)
+        .where(InstrumentModel.ticker == ticker)
+        .values(seq=InstrumentModel.seq + 1)
+        .returning(InstrumentModel.seq)
+        .execution_options(synchronize_session=False)
+    )
+    seq = result.scalar_one_or_none()
+    if seq is None:
+        raise HTTPException(status_code=404, detail=f"Ticker '{ticker}' Not Found")
+    return seq
+
+
 # orderbook
 async def get_bids(ticker: str, limit: int, db: AsyncSession):
     db_bids = await db.execute(
@@ -313,7 +495,7 @@ async def get_asks(ticker: str, limit: int, db: AsyncSession):
     return list(db_asks.scalars().all())
 
 
-def aggregate_orders(orders: List[OrderModel], is_bid: bool) -> List[Level]:
+def aggregate_levels(orders: List[OrderModel], is_bid: bool) -> List[dict]:
     levels = dict()
     for order in orders:
         if order.type == "MARKET":
@@ -324,43 +506,154 @@ def aggregate_orders(orders: List[OrderModel], is_bid: bool) -> List[Level]:
             continue
         levels[order.price] = levels.get(order.price, 0) + remaining_qty
 
-    return sorted(
-        [Level(price=price, qty=qty) for price, qty in levels.items()],
-        key=lambda lvl: lvl.price,
-        reverse=is_bid
+    return [
+        {"price": price, "qty": qty}
+        for price, qty in sorted(levels.items(), reverse=is_bid)
+    ]
+
+
+def aggregate_orders(orders: List[OrderModel], is_bid: bool) -> List[Level]:
+    return [Level(**level) for level in aggregate_levels(orders, is_bid)]
+
+
+async def get_resting_quantities(ticker: str, db: AsyncSession):
+    """(is_bid, price, remaining_qty) columns of the ticker's resting limit orders as arrays, without ORM objects."""
+    result = await db.execute(
+        select(
+            func.array_agg(OrderModel.direction == Direction.BUY),
+            func.array_agg(OrderModel.price),
+            func.array_agg(OrderModel.qty - OrderModel.filled)
+        )
+        .where(
+            and_(
+                OrderModel.status.in_([OrderStatus.NEW, OrderStatus.PARTIALLY_EXECUTED]),
+                OrderModel.ticker == ticker,
+                OrderModel.price.isnot(None)
+            )
+        )
     )
+    return result.one()
 
 
-# transactions
-async def get_transactions_by_ticker(ticker: str, limit: int, db: AsyncSession):
+async def get_orderbooks(tickers: List[str], depth: int, db: AsyncSession) -> Dict[str, dict]:
+    """L2 books for several tickers in one query: levels are summed in the DB and cut by a window function."""
+    levels = (
+        select(
+            OrderModel.ticker,
+            OrderModel.direction,
+            OrderModel.price,
+            func.sum(OrderModel.qty - OrderModel.filled).label("qty")
+        )
+        .where(
+            and_(
+                OrderModel.status.in_([OrderStatus.NEW, OrderStatus.PARTIALLY_EXECUTED]),
+                OrderModel.ticker.in_(tickers),
+                OrderModel.price.isnot(None)
+            )
+        )
+        .group_by(OrderModel.ticker, OrderModel.direction, OrderModel.price)
+        .having(func.sum(OrderModel.qty - OrderModel.filled) > 0)
+        .subquery()
+    )
+    level_rank = func.row_number().over(
+        partition_by=(levels.c.ticker, levels.c.direction),
+        order_by=case((levels.c.direction == Direction.BUY, -levels.c.price), else_=levels.c.price)
+    ).label("level_rank")
+    ranked = select(levels, level_rank).subquery()
     result = await db.execute(
-        select(TransactionModel)
-        .filter_by(ticker=ticker)
-        .order_by(desc(TransactionModel.timestamp))
-        .limit(limit)
+        select(ranked.c.ticker, ranked.c.direction, ranked.c.price, ranked.c.qty)
+        .where(ranked.c.level_rank <= depth)
+        .order_by(ranked.c.ticker, ranked.c.direction, ranked.c.level_rank)
     )
+
+    books = {ticker: {"bid_levels": [], "ask_levels": []} for ticker in tickers}
+    for ticker, direction, price, qty in result:
+        side = "bid_levels" if direction == Direction.BUY else "ask_levels"
+        books[ticker][side].append({"price": price, "qty": qty})
+    return books
+
+
+# transactions
+async def get_transactions_by_ticker(ticker: str, limit: int, db: AsyncSession, after: Optional[int] = None):
+    query = select(TransactionModel).filter_by(ticker=ticker)
+    if after is None:
+        query = query.order_by(desc(TransactionModel.timestamp))
+    else:
+        # Incremental read: trades after seq 'after' in execution order
+        query = query.where(TransactionModel.seq > after).order_by(asc(TransactionModel.seq))
+    result = await db.execute(query.limit(limit))
     return list(result.scalars().all())
 
 
-async def record_transaction(ticker: str, price: int, qty: int, db: AsyncSession):
+async def record_transaction(ticker: str, price: int, qty: int, seq: int, db: AsyncSession):
     if ticker is None:
         raise HTTPException(status_code=400, detail="Ticker must be provided")
+    timestamp = datetime.now(timezone.utc)
+    await ensure_monthly_partitions(TransactionModel.__tablename__, [timestamp])
     db_transaction = TransactionModel(
         ticker=ticker,
         price=price,
         qty=qty,
-        timestamp=datetime.now(timezone.utc)
+        seq=seq,
+        timestamp=timestamp
     )
     db.add(db_transaction)
 
 
+def record_fills(taker: OrderModel, maker: OrderModel, price: int, qty: int, seq: int, db: AsyncSession):
+    timestamp = datetime.now(timezone.utc)
+    fills = [
+        FillModel(
+            order_id=order.id,
+            user_id=order.user_id,
+            ticker=order.ticker,
+            direction=order.direction,
+            liquidity=liquidity,
+            price=price,
+            qty=qty,
+            seq=seq,
+            timestamp=timestamp
+        )
+        for order, liquidity in ((taker, Liquidity.TAKER), (maker, Liquidity.MAKER))
+    ]
+    db.add_all(fills)
+    fills_recorded(fills, db)
+
+
+async def get_fill_cursor(user_id: UUID, db: AsyncSession) -> Dict[str, int]:
+    result = await db.execute(
+        select(FillModel.ticker, func.max(FillModel.seq)).where(FillModel.user_id == user_id).group_by(FillModel.ticker)
+    )
+    return {ticker: seq for ticker, seq in result}
+
+
+async def get_fills_by_user(user_id: UUID, after: Dict[str, int], limit: int, db: AsyncSession):
+    """Fills after a {ticker: seq} cursor. Per-ticker numbers are issued under the instrument lock,
+    so within a ticker fills commit in seq order, unlike id."""
+    last_seq = case(after, value=FillModel.ticker, else_=0) if after else literal(0)
+    result = await db.execute(
+        select(FillModel)
+        .where(and_(FillModel.user_id == user_id, FillModel.seq > last_seq))
+        .order_by(asc(FillModel.id))
+        .limit(limit)
+    )
+    fills = list(result.scalars().all())
+    if len(fills) == limit:
+        # Both sides of a self-trade share a seq; don't split them across batches
+        last = (fills[-1].ticker, fills[-1].seq)
+        trimmed = [fill for fill in fills if (fill.ticker, fill.seq) != last]
+        fills = trimmed or fills
+    return fills
+
+
 # orders
 def create_order_dict(order: OrderModel):
     order_dict = {
         "id": order.id,
         "status": order.status,
         "user_id": order.user_id,
-        "timestamp": order.timestamp
+        "timestamp": order.timestamp,
+        "seq": order.seq
     }
 
     if order.type == "MARKET":
@@ -377,7 +670,8 @@ def create_order_dict(order: OrderModel):
             direction=order.direction,
             ticker=order.ticker,
             qty=order.qty,
-            price=order.price
+            price=order.price,
+            time_in_force=order.time_in_force
         )
         order_dict["body"] = order_body
         order_dict["filled"] = order.filled
@@ -385,7 +679,7 @@ def create_order_dict(order: OrderModel):
 
 
 async def create_order_in_db(order_data: Union[LimitOrderBody, MarketOrderBody],
-                             price: Optional[int], user_id: UUID, db: AsyncSession):
+                             price: Optional[int], user_id: UUID, seq: int, db: AsyncSession):
     order_dict = {
         "id": uuid4(),
         "status": OrderStatus.NEW,
@@ -394,7 +688,9 @@ async def create_order_in_db(order_data: Union[LimitOrderBody, MarketOrderBody],
         "direction": order_data.direction,
         "ticker": order_data.ticker,
         "qty": order_data.qty,
-        "price": price
+        "price": price,
+        "entry_seq": seq,
+        "seq": seq
     }
 
     if isinstance(order_data, MarketOrderBody):
@@ -403,22 +699,44 @@ async def create_order_in_db(order_data: Union[LimitOrderBody, MarketOrderBody],
     elif isinstance(order_data, LimitOrderBody):
         order_dict["filled"] = 0
         order_dict["type"] = "LIMIT"
+        order_dict["time_in_force"] = order_data.time_in_force
 
     db_order = OrderModel(**order_dict)
     db.add(db_order)
     return db_order
 
 
+def all_orders():
+    # One statement over both tables: the archive task can't move an order between two reads
+    return union_all(
+        select(*OrderModel.__table__.columns),
+        select(*OrderHistoryModel.__table__.columns)
+    ).subquery("all_orders")
+
+
 async def get_order_by_id(order_id: UUID, db: AsyncSession):
-    result = await db.execute(select(OrderModel).filter_by(id=order_id))
-    return result.scalar_one_or_none()
+    orders = all_orders()
+    result = await db.execute(select(orders).where(orders.c.id == order_id))
+    return result.one_or_none()
 
 
 async def get_orders_by_user(user_id: UUID, db: AsyncSession):
-    result = await db.execute(select(OrderModel).filter_by(user_id=user_id))
-    return list(result.scalars().all())
+    return await get_order_rows_by_user(user_id, db)
+
+
+async def get_order_rows_by_user(user_id: UUID, db: AsyncSession,
+                                 ticker: Optional[str] = None, after: Optional[int] = None):
+    orders = all_orders()
+    query = select(orders).where(orders.c.user_id == user_id)
+    if ticker is not None:
+        query = query.where(orders.c.ticker == ticker)
+    if after is not None:
+        query = query.where(orders.c.seq > after).order_by(orders.c.seq)
+    result = await db.execute(query)
+    return result.all()
 
 
+@traced("settle")
 async def process_trade(
     is_buy: bool,
     user_id: UUID,
@@ -426,6 +744,7 @@ async def process_trade(
     ticker: str,
     trade_qty: int,
     trade_price: int,
+    seq: int,
     db: AsyncSession
 ):
     trade_amount = trade_qty * trade_price
@@ -445,27 +764,27 @@ async def process_trade(
             (counterparty_id, "RUB", -trade_amount),
             (counterparty_id, ticker, trade_qty),
         ]
-    await lock_and_update_balance(changes, db)
-
+    # Release the reserve on both sides: the maker held its qty in the book
     if is_buy:
-        await reserve_balance(user_id, ticker_rub, -trade_amount, db)
+        releases = {(user_id, ticker_rub): trade_amount, (counterparty_id, ticker): trade_qty}
     else:
-        await reserve_balance(user_id, ticker, -trade_qty, db)
+        releases = {(user_id, ticker): trade_qty, (counterparty_id, ticker_rub): trade_amount}
+    await lock_and_update_balance(changes, db, releases)
 
-    await record_transaction(ticker, trade_price, trade_qty, db)
+    await record_transaction(ticker, trade_price, trade_qty, seq, db)
 
 
-async def update_order_status_and_filled(order: OrderModel, filled_increment: int, db: AsyncSession):
+async def update_order_status_and_filled(order: OrderModel, filled_increment: int, seq: int, db: AsyncSession):
+    asset, exposure = order_exposure(order)
     order.filled += filled_increment
-    if order.filled == order.qty:
-        order.status = OrderStatus.EXECUTED
-    elif order.filled > 0:
-        order.status = OrderStatus.PARTIALLY_EXECUTED
-    else:
-        order.status = OrderStatus.NEW
+    expect_reservation(order.user_id, asset, order_exposure(order)[1] - exposure, db)
+    order.seq = seq
+    order.status = order_status(order.qty, order.filled)
     db.add(order)
+    order_changed(order.id, db)
 
 
+@traced("match_market")
 async def execute_market_order(market_order: OrderModel, max_price: int, db: AsyncSession):
     remaining_qty = market_order.qty
     ticker = market_order.ticker
@@ -486,51 +805,46 @@ async def execute_market_order(market_order: OrderModel, max_price: int, db: Asy
                 OrderModel.price.isnot(None)
             )
         )
-        .order_by(asc(OrderModel.price) if is_buy else desc(OrderModel.price))
+        .order_by(asc(OrderModel.price) if is_buy else desc(OrderModel.price), asc(OrderModel.entry_seq))
     )
     limit_orders = list(result.scalars().all())
-    if sum([q.qty for q in limit_orders]) < market_order.qty:
+    if not has_liquidity((order.qty for order in limit_orders), market_order.qty):
         raise HTTPException(status_code=400, detail="Not enough liquidity to fill market order")
 
-    total_filled = 0
-    for limit_order in limit_orders:
-        available_qty = limit_order.qty - limit_order.filled
-        if available_qty <= 0:
-            continue
+    spent = 0
 
-        trade_qty = min(remaining_qty, available_qty)
-        trade_price = limit_order.price
+    async def settle(limit_order: OrderModel, trade_qty: int, trade_price: int) -> bool:
+        nonlocal spent
         seller_id = limit_order.user_id
-
-        counterparty_ticker_balance = await check_balance_record(seller_id, ticker, db)
-        counterparty_rub_balance = await check_balance_record(seller_id, ticker_rub, db)
-        if counterparty_ticker_balance is None or (
-            (is_buy and counterparty_ticker_balance.amount < trade_qty) or
-            (not is_buy and counterparty_rub_balance.amount < trade_qty * trade_price)
-        ):
-            continue
-
-        await process_trade(is_buy, user_id, seller_id, ticker, trade_qty, trade_price, db)
-        await update_order_status_and_filled(limit_order, trade_qty, db)
-
-        remaining_qty -= trade_qty
-        total_filled += trade_qty
-
-        if remaining_qty == 0:
-            break
-
-    if total_filled == 0:
-        market_order.status = OrderStatus.CANCELLED
-        if market_order.direction == Direction.SELL:
-            await reserve_balance(market_order.user_id, market_order.ticker, -market_order.qty, db)
-        elif market_order.direction == Direction.BUY:
-            cost = market_order.qty * max_price
-            await reserve_balance(market_order.user_id, "RUB", -cost, db)
-        db.add(market_order)
-        await db.commit()
-        raise HTTPException(status_code=400, detail="No matching orders in the orderbook")
-    market_order.status = OrderStatus.EXECUTED
+        if is_buy:
+            has_balance = await check_balance_amount(seller_id, ticker, trade_qty, db)
+        else:
+            has_balance = await check_balance_amount(seller_id, ticker_rub, trade_qty * trade_price, db)
+        if not has_balance:
+            return False
+
+        seq = await next_sequence(ticker, db)
+        await process_trade(is_buy, user_id, seller_id, ticker, trade_qty, trade_price, seq, db)
+        record_fills(market_order, limit_order, trade_price, trade_qty, seq, db)
+        await update_order_status_and_filled(limit_order, trade_qty, seq, db)
+        market_order.seq = seq
+        spent += trade_qty * trade_price
+        return True
+
+    resting = ((order, order.price, order.qty - order.filled) for order in limit_orders)
+    remaining_qty = await drive(match_steps(is_buy, None, remaining_qty, resting), settle)
+
+    # Market orders never rest: return everything not spent on trades,
+    # including the gap between the worst-price reserve and the actual cost
+    leftover = market_order.qty * max_price - spent if is_buy else remaining_qty
+    if leftover > 0:
+        await reserve_balance(user_id, ticker_rub if is_buy else ticker, -leftover, db)
+
+    market_order.status = resolve_order(True, market_order.time_in_force, market_order.qty, market_order.qty - remaining_qty)
+    if market_order.status == OrderStatus.CANCELLED:
+        market_order.seq = await next_sequence(ticker, db)
     db.add(market_order)
+    order_changed(market_order.id, db)
     return market_order
 
 
@@ -703,6 +1017,7 @@ async def execute_market_order(market_order: OrderModel, max_price: int, db: Asy
 #     return market_order
 
 
+@traced("match_limit")
 async def execute_limit_order(limit_order: OrderModel, db: AsyncSession):
     remaining_qty = limit_order.qty - limit_order.filled
     ticker = limit_order.ticker
@@ -725,44 +1040,124 @@ async def execute_limit_order(limit_order: OrderModel, db: AsyncSession):
                 price_condition
             )
         )
-        .order_by(asc(OrderModel.price) if is_buy else desc(OrderModel.price))
+        .order_by(asc(OrderModel.price) if is_buy else desc(OrderModel.price), asc(OrderModel.entry_seq))
     )
     matching_orders = list(result.scalars().all())
 
-    total_filled = 0
-    for match in matching_orders:
-        available_qty = match.qty - match.filled
-        if available_qty <= 0:
-            continue
-
-        trade_qty = min(remaining_qty, available_qty)
-        trade_price = match.price
+    async def settle(match: OrderModel, trade_qty: int, trade_price: int) -> bool:
         counterparty_id = match.user_id
+        if is_buy:
+            has_balance = await check_balance_amount(counterparty_id, ticker, trade_qty, db)
+        else:
+            has_balance = await check_balance_amount(counterparty_id, ticker_rub, trade_qty * trade_price, db)
+        if not has_balance:
+            return False
+
+        seq = await next_sequence(ticker, db)
+        await process_trade(is_buy, user_id, counterparty_id, ticker, trade_qty, trade_price, seq, db)
+        if is_buy and trade_price < limit_order.price:
+            # The reserve was taken at the order's price, but the trade went through at the maker's better price
+            await reserve_balance(user_id, ticker_rub, (trade_price - limit_order.price) * trade_qty, db)
+        record_fills(limit_order, match, trade_price, trade_qty, seq, db)
+        await update_order_status_and_filled(match, trade_qty, seq, db)
+        limit_order.seq = seq
+        return True
+
+    resting = ((order, order.price, order.qty - order.filled) for order in matching_orders)
+    unfilled = await drive(match_steps(is_buy, limit_order.price, remaining_qty, resting), settle)
+    limit_order.filled += remaining_qty - unfilled
+    remaining_qty = unfilled
+
+    status = resolve_order(False, limit_order.time_in_force, limit_order.qty, limit_order.filled)
+    if status is None:
+        # Rolling back the transaction undoes both the reserve and the trades already settled
+        raise HTTPException(status_code=400, detail="FOK order could not be filled in full")
+
+    if status == OrderStatus.CANCELLED:
+        if is_buy:
+            await reserve_balance(user_id, ticker_rub, -remaining_qty * limit_order.price, db)
+        else:
+            await reserve_balance(user_id, ticker, -remaining_qty, db)
+        limit_order.seq = await next_sequence(ticker, db)
+    limit_order.status = status
 
-        counterparty_ticker_balance = await check_balance_record(counterparty_id, ticker, db)
-        counterparty_rub_balance = await check_balance_record(counterparty_id, ticker_rub, db)
-        if counterparty_ticker_balance is None or (
-                (is_buy and counterparty_ticker_balance.amount < trade_qty) or
-                (not is_buy and counterparty_rub_balance.amount < trade_qty * trade_price)
-        ):
-            continue
+    if limit_order.status in [OrderStatus.NEW, OrderStatus.PARTIALLY_EXECUTED]:
+        asset, exposure = order_exposure(limit_order)
+        expect_reservation(user_id, asset, exposure, db)
 
-        await process_trade(is_buy, user_id, counterparty_id, ticker, trade_qty, trade_price, db)
-        await update_order_status_and_filled(match, trade_qty, db)
+    db.add(limit_order)
+    order_changed(limit_order.id, db)
+    return limit_order
 
-        remaining_qty -= trade_qty
-        total_filled += trade_qty
 
-        if remaining_qty <= 0:
-            break
+async def place_order(order_data: Union[LimitOrderBody, MarketOrderBody], user_id: UUID, db: AsyncSession):
+    max_price = None
+    discard_reservations(db)
+    # Take the number first: the instrument row lock orders requests per ticker
+    # and is taken before balance locks, as on cancel
+    seq = await next_sequence(order_data.ticker, db)
+
+    if isinstance(order_data, LimitOrderBody) and order_data.time_in_force == TimeInForce.FOK:
+        liquidity = await get_available_liquidity(order_data.ticker, order_data.direction, order_data.price, db)
+        if liquidity < order_data.qty:
+            raise HTTPException(status_code=400, detail="Not enough liquidity to fill FOK order")
+
+    with span("reserve"):
+        if order_data.direction == Direction.SELL:
+            await reserve_balance(user_id, order_data.ticker, order_data.qty, db)
+
+        elif (order_data.direction == Direction.BUY) and (isinstance(order_data, LimitOrderBody)):
+            cost = order_data.qty * order_data.price
+            await reserve_balance(user_id, "RUB", cost, db)
+
+        elif (order_data.direction == Direction.BUY) and (isinstance(order_data, MarketOrderBody)):
+            max_price = await get_max_price_for_market_rub_reserve(order_data.ticker, db)
+            if max_price is None:
+                raise HTTPException(status_code=400, detail="No liquidity to estimate market order cost")
+            cost = order_data.qty * max_price
+            await reserve_balance(user_id, "RUB", cost, db)
+
+    with span("match"):
+        if isinstance(order_data, MarketOrderBody):
+            db_order = await create_order_in_db(order_data=order_data, price=None, user_id=user_id, seq=seq, db=db)
+            db_order = await execute_market_order(db_order, max_price, db=db)
+        else:
+            db_order = await create_order_in_db(order_data=order_data, price=order_data.price, user_id=user_id, seq=seq, db=db)
+            db_order = await execute_limit_order(db_order, db=db)
 
-    limit_order.filled += total_filled
-    if limit_order.filled == 0:
-        limit_order.status = OrderStatus.NEW
-    elif limit_order.filled < limit_order.qty:
-        limit_order.status = OrderStatus.PARTIALLY_EXECUTED
-    else:
-        limit_order.status = OrderStatus.EXECUTED
+    await flush_reservations(db)
+    return db_order
 
-    db.add(limit_order)
-    return limit_order
+
+async def cancel_user_order(order_id: UUID, user_id: UUID, db: AsyncSession):
+    discard_reservations(db)
+    result = await db.execute(select(OrderModel.ticker).filter_by(id=order_id))
+    ticker = result.scalar_one_or_none()
+    seq = await next_sequence(ticker, db) if ticker is not None else None
+
+    result = await db.execute(select(OrderModel).filter_by(id=order_id).with_for_update())
+    db_order = result.scalar_one_or_none()
+    if db_order is None:
+        db_order = await get_order_by_id(order_id, db)
+    if db_order is None:
+        raise HTTPException(status_code=404, detail="Order Not Found")
+    if user_id != db_order.user_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if db_order.status in [OrderStatus.EXECUTED, OrderStatus.CANCELLED]:
+        raise HTTPException(status_code=400, detail=f"Order Is Already {db_order.status}")
+
+    unfilled_qty = db_order.qty - db_order.filled
+    if unfilled_qty > 0:
+        if db_order.direction == Direction.BUY:
+            refund = unfilled_qty * db_order.price
+            await reserve_balance(db_order.user_id, "RUB", -refund, db)
+        else:
+            await reserve_balance(db_order.user_id, db_order.ticker, -unfilled_qty, db)
+        asset, exposure = order_exposure(db_order)
+        expect_reservation(db_order.user_id, asset, -exposure, db)
+
+    db_order.status = OrderStatus.CANCELLED
+    db_order.seq = seq
+    order_changed(db_order.id, db)
+    await flush_reservations(db)
+    return db_order